@@ -11,44 +11,50 @@ Or without a real wallet (uses a mock for testing):
     python examples/fastapi_demo.py
 """
 
-import hashlib
+import datetime
 import os
+import random
 import secrets
 import time
+from dataclasses import dataclass
+from typing import Any, Optional
 
+import orjson
 import uvicorn
-from fastapi import Depends, FastAPI, Request
+from fastapi import Depends, FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 
 # --- Mock wallet for demo (when no NWC_URL is provided) ---
 
 
+@dataclass(frozen=True)
+class MockInvoice:
+    invoice: str
+    payment_hash: str
+
+
+@dataclass(frozen=True)
+class MockPayResult:
+    paid: bool = False
+    preimage: Optional[str] = None
+
+
+UNPAID = MockPayResult()
+
+
 class MockWallet:
     """Mock wallet that generates fake invoices for testing the L402 flow."""
 
     async def create_invoice(self, amount_sats: int, description: str = "", expiry: int = 300):
-        from dataclasses import dataclass
-
-        payment_hash = hashlib.sha256(secrets.token_bytes(32)).hexdigest()
-
-        @dataclass
-        class Result:
-            invoice: str
-            payment_hash: str
+        payment_hash = secrets.token_hex(32)
 
-        return Result(
+        return MockInvoice(
             invoice=f"lnbc{amount_sats}0n1demo{secrets.token_hex(20)}",
             payment_hash=payment_hash,
         )
 
     async def wait_for_payment(self, payment_hash: str, timeout_ms: int = 300000):
-        from dataclasses import dataclass
-
-        @dataclass
-        class Result:
-            paid: bool = False
-            preimage: str = None
-
-        return Result()
+        return UNPAID
 
     async def close(self):
         pass
@@ -56,7 +62,16 @@ class MockWallet:
 
 # --- Setup ---
 
+
+class OrjsonResponse(JSONResponse):
+    """JSON response encoded with orjson (FastAPI's ORJSONResponse is deprecated)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
 app = FastAPI(
+    default_response_class=OrjsonResponse,
     title="lightning-toll Demo",
     description="L402 Lightning paywall demo with FastAPI",
     version="0.1.0",
@@ -78,60 +93,78 @@ else:
     print("🧪 Using mock wallet (set NWC_URL for real payments)")
 
 
+# --- Content ---
+
+UTC = datetime.timezone.utc
+
+JOKES = (
+    "Why do programmers prefer dark mode? Because light attracts bugs.",
+    "A SQL query walks into a bar, walks up to two tables and asks: 'Can I join you?'",
+    "There are only 10 types of people: those who understand binary and those who don't.",
+    "Why was the JavaScript developer sad? Because he didn't Node how to Express himself.",
+    "A programmer's wife says 'Go to the store and get a loaf of bread. If they have eggs, get a dozen.' He comes home with 12 loaves.",
+    "!false — it's funny because it's true.",
+    "Why do Bitcoin HODLers make bad comedians? They never sell the punchline.",
+)
+
+FORTUNES = (
+    "The blocks will keep coming. So will you.",
+    "Your next UTXO will be your luckiest.",
+    "A wise node operator once said: 'Fees are just applause for miners.'",
+    "You will find a forgotten seed phrase in an unexpected place.",
+    "The Lightning Network predicts fast payments in your future.",
+    "Stack sats. Stay humble. The rest follows.",
+    "Your channel capacity will grow like your conviction.",
+)
+
+
+# Static welcome payload, serialized once at import
+ROOT_PAYLOAD = {
+    "service": "lightning-toll demo",
+    "description": "L402 Lightning paywall demo for FastAPI",
+    "endpoints": {
+        "GET /api/joke": {"price": "5 sats", "description": "Random programming joke"},
+        "GET /api/time": {"price": "1 sat", "description": "Current server time"},
+        "GET /api/fortune": {"price": "10 sats", "description": "Bitcoin fortune cookie"},
+        "GET /api/free-tier": {
+            "price": "21 sats (3 free/hr)",
+            "description": "Free tier demo",
+        },
+        "GET /api/stats": {"price": "Free", "description": "Revenue dashboard"},
+    },
+    "how_to_pay": {
+        "step1": "GET any paid endpoint to receive a 402 + Lightning invoice",
+        "step2": "Pay the invoice with any Lightning wallet",
+        "step3": "Retry with Authorization: L402 <macaroon>:<preimage>",
+    },
+}
+ROOT_BYTES = orjson.dumps(ROOT_PAYLOAD)
+
+
 # --- Routes ---
 
 
 @app.get("/")
 async def root():
     """Welcome page with available endpoints."""
-    return {
-        "service": "lightning-toll demo",
-        "description": "L402 Lightning paywall demo for FastAPI",
-        "endpoints": {
-            "GET /api/joke": {"price": "5 sats", "description": "Random programming joke"},
-            "GET /api/time": {"price": "1 sat", "description": "Current server time"},
-            "GET /api/fortune": {"price": "10 sats", "description": "Bitcoin fortune cookie"},
-            "GET /api/free-tier": {
-                "price": "21 sats (3 free/hr)",
-                "description": "Free tier demo",
-            },
-            "GET /api/stats": {"price": "Free", "description": "Revenue dashboard"},
-        },
-        "how_to_pay": {
-            "step1": "GET any paid endpoint to receive a 402 + Lightning invoice",
-            "step2": "Pay the invoice with any Lightning wallet",
-            "step3": "Retry with Authorization: L402 <macaroon>:<preimage>",
-        },
-    }
+    return Response(content=ROOT_BYTES, media_type="application/json")
 
 
 @app.get("/api/joke")
 async def joke(payment=Depends(toll(sats=5, description="Random programming joke"))):
     """Get a random programming joke — 5 sats."""
-    import random
-
-    jokes = [
-        "Why do programmers prefer dark mode? Because light attracts bugs.",
-        "A SQL query walks into a bar, walks up to two tables and asks: 'Can I join you?'",
-        "There are only 10 types of people: those who understand binary and those who don't.",
-        "Why was the JavaScript developer sad? Because he didn't Node how to Express himself.",
-        "A programmer's wife says 'Go to the store and get a loaf of bread. If they have eggs, get a dozen.' He comes home with 12 loaves.",
-        "!false — it's funny because it's true.",
-        "Why do Bitcoin HODLers make bad comedians? They never sell the punchline.",
-    ]
-    return {"joke": random.choice(jokes), "payment": payment}
+    return {"joke": random.choice(JOKES), "payment": payment}
 
 
 @app.get("/api/time")
 async def server_time(payment=Depends(toll(sats=1, description="Current server time"))):
     """Get current server time — 1 sat."""
-    import datetime
-
-    now = datetime.datetime.now(datetime.timezone.utc)
+    now = datetime.datetime.now(UTC)
+    unix = int(now.timestamp())
     return {
         "time": now.isoformat(),
-        "unix": int(now.timestamp()),
-        "block_height_estimate": "~" + str(int(now.timestamp()) // 600),
+        "unix": unix,
+        "block_height_estimate": "~" + str(unix // 600),
         "payment": payment,
     }
 
@@ -139,18 +172,7 @@ async def server_time(payment=Depends(toll(sats=1, description="Current server t
 @app.get("/api/fortune")
 async def fortune(payment=Depends(toll(sats=10, description="Bitcoin fortune cookie"))):
     """Get a Bitcoin-themed fortune — 10 sats."""
-    import random
-
-    fortunes = [
-        "The blocks will keep coming. So will you.",
-        "Your next UTXO will be your luckiest.",
-        "A wise node operator once said: 'Fees are just applause for miners.'",
-        "You will find a forgotten seed phrase in an unexpected place.",
-        "The Lightning Network predicts fast payments in your future.",
-        "Stack sats. Stay humble. The rest follows.",
-        "Your channel capacity will grow like your conviction.",
-    ]
-    return {"fortune": random.choice(fortunes), "payment": payment}
+    return {"fortune": random.choice(FORTUNES), "payment": payment}
 
 
 @app.get("/api/free-tier")
@@ -189,4 +211,5 @@ if __name__ == "__main__":
     print("Test:")
     print("  curl http://localhost:8402/api/joke")
     print()
-    uvicorn.run(app, host="0.0.0.0", port=8402)
+    # loop/http "auto" pick uvloop and httptools when installed (uvicorn[standard])
+    uvicorn.run(app, host="0.0.0.0", port=8402, loop="auto", http="auto", log_level="warning")
@@ -27,6 +27,8 @@ from .macaroon import (
     create_macaroon,
     decode_macaroon,
     verify_macaroon,
+    verify_macaroon_raw,
+    verify_macaroons,
     verify_preimage,
 )
 from .stats import TollStats
@@ -42,6 +44,8 @@ __all__ = [
     "create_macaroon",
     "decode_macaroon",
     "verify_macaroon",
+    "verify_macaroon_raw",
+    "verify_macaroons",
     "verify_preimage",
     "Macaroon",
     "VerifyResult",
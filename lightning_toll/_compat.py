@@ -0,0 +1,40 @@
+"""
+Optional accelerated backends.
+
+Installing the speedups extra (pip install "lightning-toll[speedups]")
+swaps in faster C/Rust implementations; without it the stdlib is used
+with the same compact output.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Any, Dict
+
+# dataclass(slots=True) needs Python 3.10+; on 3.9 instances keep a __dict__
+DATACLASS_SLOTS: Dict[str, bool] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> bytes:
+        """Serialize to compact JSON bytes."""
+        return orjson.dumps(obj)
+
+    json_loads = orjson.loads
+
+except ImportError:
+    import json
+
+    def json_dumps(obj: Any) -> bytes:
+        """Serialize to compact JSON bytes."""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    json_loads = json.loads
+
+try:
+    from pybase64 import b64decode, b64encode, urlsafe_b64decode, urlsafe_b64encode
+except ImportError:
+    from base64 import b64encode, urlsafe_b64decode, urlsafe_b64encode  # noqa: F401
+    # Same lenient decoding as base64.b64decode, without its Python wrapper
+    from binascii import a2b_base64 as b64decode  # noqa: F401
@@ -1,9 +1,11 @@
 """
 Client SDK for consuming L402-paywalled APIs.
 
-Provides TollClient and toll_fetch for automatic Lightning payment handling.
+Provides TollClient, toll_fetch and toll_fetch_many for automatic Lightning
+payment handling.
 """
 
-from .fetch import TollClient, toll_fetch
+from .cache import CachedCredential, CredentialCache
+from .fetch import TollClient, toll_fetch, toll_fetch_many
 
-__all__ = ["TollClient", "toll_fetch"]
+__all__ = ["TollClient", "toll_fetch", "toll_fetch_many", "CredentialCache", "CachedCredential"]
@@ -0,0 +1,221 @@
+"""
+Credential cache for the L402 client.
+
+Paid credentials are keyed on method + origin + path (query string dropped),
+matching how the server binds macaroons to an endpoint and HTTP method.
+The cache is a bounded LRU so long-lived clients fetching many endpoints
+don't grow without limit, and it can be shared between TollClient instances.
+
+Optionally the LRU is backed by an on-disk store (diskcache) so paid
+credentials survive process restarts until they actually expire.
+"""
+
+from __future__ import annotations
+
+import heapq
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .._compat import DATACLASS_SLOTS, json_dumps, json_loads
+
+
+@dataclass(frozen=True, **DATACLASS_SLOTS)
+class CachedCredential:
+    """Cached L402 credential for a paid endpoint."""
+    macaroon: str
+    preimage: str
+    expiry: float  # time.monotonic() deadline after which this credential expires
+    amount_sats: int = 0
+    payment_hash: Optional[str] = None
+    soft_expiry: Optional[float] = None  # Monotonic; after this, refresh in the background
+    wall_expiry: Optional[float] = None  # Unix timestamp of expiry, for persistence
+
+
+@lru_cache(maxsize=4096)
+def cache_key(method: str, url: str) -> str:
+    """
+    Build the cache key for a request.
+
+    Memoized, since each fetch derives the key for the same URL more than once
+    and clients tend to hit a small set of URLs repeatedly.
+
+    Args:
+        method: HTTP method.
+        url: Full request URL.
+
+    Returns:
+        Key of the form "GET:https://host/path".
+    """
+    parts = urlsplit(url)
+    return f"{method.upper()}:{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+class DiskStore:
+    """Persistent credential store backed by diskcache, with per-entry TTL."""
+
+    def __init__(self, directory: str):
+        """
+        Open (or create) the store.
+
+        Args:
+            directory: Directory holding the diskcache database.
+        """
+        import diskcache
+
+        self._cache: Any = diskcache.Cache(directory)
+
+    def get(self, key: str) -> Optional[CachedCredential]:
+        """Get a stored credential, or None if missing or expired."""
+        raw = self._cache.get(key)
+        if raw is None:
+            return None
+        data = json_loads(raw)
+        # Monotonic deadlines don't carry over between processes: rebase them
+        # on this process's clock from the stored wall-clock expiry
+        shift = time.monotonic() + (data["wall_expiry"] - time.time()) - data["expiry"]
+        data["expiry"] += shift
+        if data.get("soft_expiry") is not None:
+            data["soft_expiry"] += shift
+        return CachedCredential(**data)
+
+    def set(self, key: str, cred: CachedCredential) -> None:
+        """Store a credential until its expiry."""
+        if cred.wall_expiry is None:
+            return
+        ttl = cred.wall_expiry - time.time()
+        if ttl > 0:
+            self._cache.set(key, json_dumps(asdict(cred)), expire=ttl)
+
+    def delete(self, key: str) -> None:
+        """Remove a credential if present."""
+        self._cache.delete(key)
+
+    def clear(self) -> None:
+        """Remove all credentials."""
+        self._cache.clear()
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        self._cache.close()
+
+
+class CredentialCache:
+    """
+    Size-bounded LRU cache of paid L402 credentials.
+
+    When cache_dir is given, the in-memory LRU acts as L1 in front of a
+    DiskStore (L2): writes go to both, and L1 misses are filled from disk.
+
+    Expired entries are swept from L1 on every write using a min-heap of
+    expiry deadlines, so credentials for URLs that are never fetched again
+    don't linger until the LRU pushes them out.
+    """
+
+    def __init__(self, maxsize: int = 1024, cache_dir: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of credentials kept in memory before the
+                least recently used one is evicted.
+            cache_dir: Directory for persisting credentials across restarts.
+                Requires diskcache (pip install "lightning-toll[persist]").
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, CachedCredential]" = OrderedDict()
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._disk: Optional[DiskStore] = DiskStore(cache_dir) if cache_dir else None
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[CachedCredential]:
+        """
+        Get an unexpired credential, marking it as recently used.
+
+        Expired credentials are removed and None is returned.
+
+        Args:
+            key: Cache key from cache_key().
+            now: Current time.monotonic() reading, if the caller already has one.
+        """
+        cred = self._entries.get(key)
+        if cred is None and self._disk is not None:
+            cred = self._disk.get(key)
+            if cred is not None:
+                self._store(key, cred)
+        if cred is None:
+            return None
+        if cred.expiry <= (time.monotonic() if now is None else now):
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return cred
+
+    def set(self, key: str, cred: CachedCredential) -> None:
+        """Store a credential, evicting the least recently used if full."""
+        self._store(key, cred)
+        if self._disk is not None:
+            self._disk.set(key, cred)
+
+    def _store(self, key: str, cred: CachedCredential) -> None:
+        """Insert into the in-memory LRU only."""
+        self._entries[key] = cred
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        heapq.heappush(self._expiry_heap, (cred.expiry, key))
+        self.sweep()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Remove expired credentials from memory.
+
+        Args:
+            now: Current time.monotonic() reading, if the caller already has one.
+
+        Returns:
+            Number of credentials removed.
+        """
+        if now is None:
+            now = time.monotonic()
+        heap = self._expiry_heap
+        removed = 0
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            cred = self._entries.get(key)
+            # Skip heap entries left behind by a replaced or evicted credential
+            if cred is not None and cred.expiry == expiry:
+                del self._entries[key]
+                removed += 1
+        # Entries for replaced/evicted credentials only leave the heap once
+        # their deadline passes; rebuild if they start to dominate it
+        if len(heap) > 2 * max(len(self._entries), self.maxsize):
+            self._expiry_heap = [(cred.expiry, key) for key, cred in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+        return removed
+
+    def delete(self, key: str) -> None:
+        """Remove a credential if present."""
+        self._entries.pop(key, None)
+        if self._disk is not None:
+            self._disk.delete(key)
+
+    def clear(self) -> None:
+        """Remove all credentials."""
+        self._entries.clear()
+        self._expiry_heap.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self) -> None:
+        """Close the on-disk store, if any."""
+        if self._disk is not None:
+            self._disk.close()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -4,52 +4,152 @@ Auto-pay fetch wrapper for L402-paywalled APIs.
 When an endpoint returns 402, automatically pays the Lightning invoice
 and retries the request with the L402 authorization header.
 
-Includes macaroon caching: paid credentials are cached per endpoint URL
-so subsequent requests reuse them without triggering a new payment cycle.
+Includes macaroon caching: paid credentials are cached per endpoint
+(method + origin + path) so subsequent requests reuse them without
+triggering a new payment cycle.
 
 Direct port of the Node.js lightning-toll client/fetch.js.
 """
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import time
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Set
 
 import httpx
 
+from .._compat import DATACLASS_SLOTS, json_dumps, json_loads
 from ..nwc import NwcWallet
+from .cache import CachedCredential, CredentialCache, cache_key
 
+try:
+    import h2  # noqa: F401 — enables HTTP/2 support in httpx
 
-@dataclass
-class CachedCredential:
-    """Cached L402 credential for a paid endpoint."""
-    macaroon: str
-    preimage: str
-    expiry: float  # Unix timestamp when this credential expires
-    amount_sats: int = 0
-    payment_hash: Optional[str] = None
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
+# Shared connection settings for the HTTP client used by TollClient
+DEFAULT_TIMEOUT = httpx.Timeout(10.0)
+DEFAULT_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=100)
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# Only requests without side effects are replayed to refresh a credential
+REFRESHABLE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+# How TollResponse.body is produced from the raw response content
+PARSE_MODES = frozenset({"auto", "json", "text", "bytes"})
+
+_UNDECODED = object()
+
+
+@dataclass(init=False, **DATACLASS_SLOTS)
 class TollResponse:
-    """Response from a toll-gated request."""
+    """
+    Response from a toll-gated request.
+
+    The raw content is kept as-is and body is decoded on first access,
+    so callers that only need the bytes never pay for a JSON parse.
+    A body passed to the constructor (or assigned) is used as-is.
+    """
     status_code: int
     headers: Dict[str, str]
-    body: Any
-    paid: bool = False
-    amount_sats: int = 0
-    payment_hash: Optional[str] = None
+    content: bytes
+    paid: bool
+    amount_sats: int
+    payment_hash: Optional[str]
+    encoding: str
+    parse: str  # "auto" (JSON, falling back to text), "json", "text" or "bytes"
+    _body: Any = field(repr=False, compare=False)
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Dict[str, str],
+        body: Any = _UNDECODED,
+        paid: bool = False,
+        amount_sats: int = 0,
+        payment_hash: Optional[str] = None,
+        content: bytes = b"",
+        encoding: str = "utf-8",
+        parse: str = "auto",
+    ) -> None:
+        # Same positional order as before lazy decoding: body stays third
+        self.status_code = status_code
+        self.headers = headers
+        self._body = body
+        self.paid = paid
+        self.amount_sats = amount_sats
+        self.payment_hash = payment_hash
+        self.content = content
+        self.encoding = encoding
+        self.parse = parse
+
+    @property
+    def body(self) -> Any:
+        """Response body, decoded according to parse."""
+        if self._body is _UNDECODED:
+            if self.parse == "bytes":
+                self._body = self.content
+            elif self.parse == "text":
+                self._body = self.text
+            elif self.parse == "json":
+                self._body = json_loads(self.content)
+            else:
+                try:
+                    self._body = json_loads(self.content)
+                except ValueError:
+                    self._body = self.text
+        return self._body
+
+    @body.setter
+    def body(self, value: Any) -> None:
+        self._body = value
+
+    @property
+    def text(self) -> str:
+        """Return content decoded as text."""
+        return self.content.decode(self.encoding, errors="replace")
 
     def json(self) -> Any:
-        """Return body as parsed JSON (already parsed)."""
-        return self.body
+        """Return body as parsed JSON (decoded on demand)."""
+        if self.parse in ("auto", "json"):
+            return self.body
+        return json_loads(self.content)
 
     @property
     def ok(self) -> bool:
         return 200 <= self.status_code < 300
 
 
+def _toll_response(response: httpx.Response, parse: str, **payment: Any) -> TollResponse:
+    """Wrap an httpx response, decoding eagerly only when parse is "json"."""
+    result = TollResponse(
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        content=response.content,
+        encoding=response.encoding or "utf-8",
+        parse=parse,
+        **payment,
+    )
+    if parse == "json":
+        result.body = json_loads(response.content)
+    return result
+
+
+def _parse_challenge(response: httpx.Response) -> Any:
+    """Decoded 402 body, or None if it isn't JSON."""
+    try:
+        return json_loads(response.content)
+    except ValueError:
+        return None
+
+
 async def auto_pay(
     url: str,
     wallet: Any,
@@ -58,7 +158,12 @@ async def auto_pay(
     body: Any = None,
     max_sats: int = 100,
     auto_retry: bool = True,
-    credential_cache: Optional[Dict[str, CachedCredential]] = None,
+    credential_cache: Optional[CredentialCache] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    bypass_cache: bool = False,
+    refresh_before: float = 0.0,
+    parse: str = "auto",
+    inflight: Optional[Dict[str, asyncio.Event]] = None,
 ) -> TollResponse:
     """
     Fetch a URL with automatic L402 payment handling.
@@ -71,92 +176,146 @@ async def auto_pay(
         body: Request body (for POST/PUT).
         max_sats: Maximum sats to pay per request.
         auto_retry: Automatically pay and retry on 402.
-        credential_cache: Optional dict for caching paid macaroons per URL.
+        credential_cache: Optional cache of paid macaroons per endpoint.
+        client: Shared httpx.AsyncClient to send requests with. When omitted,
+            a temporary client is opened and closed for this call only.
+        bypass_cache: Ignore any cached credential and pay for a fresh one
+            (which is then cached as usual).
+        refresh_before: Mark newly cached credentials for background refresh
+            this many seconds before they expire.
+        parse: How to decode the response body: "auto" (lazily, JSON with a
+            text fallback), "json" (eagerly, raising on invalid JSON),
+            "text", or "bytes" (never decoded).
+        inflight: Payment flows in progress, by cache key, shared between
+            concurrent calls. Once a 402 is seen, only one call per endpoint
+            pays; the others wait for it and reuse the credential it cached.
+            Requests that never get a 402 are not held up.
 
     Returns:
         TollResponse with status, headers, body, and payment info.
     """
     if not wallet:
         raise ValueError("lightning-toll/client: wallet is required")
+    if parse not in PARSE_MODES:
+        raise ValueError(f"lightning-toll/client: Unknown parse mode {parse!r}")
+
+    if client is None:
+        async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=DEFAULT_TIMEOUT) as one_shot:
+            return await auto_pay(
+                url,
+                wallet,
+                method=method,
+                headers=headers,
+                body=body,
+                max_sats=max_sats,
+                auto_retry=auto_retry,
+                credential_cache=credential_cache,
+                client=one_shot,
+                bypass_cache=bypass_cache,
+                refresh_before=refresh_before,
+                parse=parse,
+                inflight=inflight,
+            )
 
-    req_headers = dict(headers or {})
-
-    async with httpx.AsyncClient() as client:
-        # Build request kwargs
-        kwargs: Dict[str, Any] = {"method": method, "url": url, "headers": req_headers}
-        if body is not None:
-            if isinstance(body, (dict, list)):
-                kwargs["json"] = body
-            else:
-                kwargs["content"] = body
-
-        # Check for cached credentials before making the request
-        if credential_cache is not None and url in credential_cache:
-            cached = credential_cache[url]
-            if cached.expiry > time.time():
-                # Use cached credentials
-                auth_header = f"L402 {cached.macaroon}:{cached.preimage}"
-                cached_headers = {**req_headers, "Authorization": auth_header}
-                kwargs["headers"] = cached_headers
-                response = await client.request(**kwargs)
-
-                # If the cached credential was accepted, return the response
-                if response.status_code != 402:
-                    try:
-                        resp_body = response.json()
-                    except Exception:
-                        resp_body = response.text
-                    return TollResponse(
-                        status_code=response.status_code,
-                        headers=dict(response.headers),
-                        body=resp_body,
-                        paid=False,  # Used cached credential, no new payment
-                        amount_sats=0,
-                        payment_hash=cached.payment_hash,
-                    )
-
-                # 402 with cached creds — credential rejected, remove from cache and fall through
-                del credential_cache[url]
+    # Never mutated below (auth variants are built as new dicts), so the
+    # caller's dict is used as-is rather than copied
+    req_headers = headers if headers is not None else {}
+
+    # Build request kwargs
+    kwargs: Dict[str, Any] = {"method": method, "url": url, "headers": req_headers}
+    if body is not None:
+        if isinstance(body, (dict, list)):
+            kwargs["content"] = json_dumps(body)
+            if not any(name.lower() == "content-type" for name in req_headers):
+                req_headers = {**req_headers, "Content-Type": "application/json"}
                 kwargs["headers"] = req_headers
-            else:
-                # Expired — remove from cache
-                del credential_cache[url]
-
-        # Make the initial request (no cached creds or cache miss)
+        else:
+            kwargs["content"] = body
+
+    # Check for cached credentials before making the request
+    key: Optional[str] = None
+    cached: Optional[CachedCredential] = None
+    if credential_cache is not None:
+        key = cache_key(method, url)
+        if not bypass_cache:
+            cached = credential_cache.get(key)
+
+    if cached is not None:
+        # Use cached credentials
+        auth_header = f"L402 {cached.macaroon}:{cached.preimage}"
+        cached_headers = {**req_headers, "Authorization": auth_header}
+        kwargs["headers"] = cached_headers
         response = await client.request(**kwargs)
 
-        # If not 402, return as-is
+        # If the cached credential was accepted, return the response
         if response.status_code != 402:
-            try:
-                resp_body = response.json()
-            except Exception:
-                resp_body = response.text
-            return TollResponse(
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                body=resp_body,
+            return _toll_response(
+                response,
+                parse,
+                paid=False,  # Used cached credential, no new payment
+                amount_sats=0,
+                payment_hash=cached.payment_hash,
             )
 
-        # If auto-retry is disabled, return the 402
-        if not auto_retry:
-            try:
-                resp_body = response.json()
-            except Exception:
-                resp_body = response.text
-            return TollResponse(
-                status_code=402,
-                headers=dict(response.headers),
-                body=resp_body,
-            )
+        # 402 with cached creds — credential rejected. The 402 already carries a
+        # fresh challenge, so drop the credential and pay that one directly
+        # instead of re-sending the request without auth.
+        credential_cache.delete(key)
+        kwargs["headers"] = req_headers
+    else:
+        # Make the initial request (no cached creds or cache miss)
+        response = await client.request(**kwargs)
+
+    # If not 402, return as-is
+    if response.status_code != 402:
+        return _toll_response(response, parse)
+
+    # If auto-retry is disabled, return the 402
+    if not auto_retry:
+        result = _toll_response(response, parse)
+        challenge = _parse_challenge(response)
+        if challenge is not None and parse in ("auto", "json"):
+            result.body = challenge
+        return result
 
-        # Parse the 402 response
-        try:
-            challenge = response.json()
-        except Exception:
+    # Single-flight: if another call is already paying for this endpoint, wait
+    # for it and retry with its credential. If it failed, the first waiter to
+    # wake takes over as the payer instead of every waiter paying at once.
+    leader: Optional[asyncio.Event] = None
+    if inflight is not None and key is not None:
+        while True:
+            pending = inflight.get(key)
+            if pending is None:
+                leader = inflight[key] = asyncio.Event()
+                break
+            await pending.wait()
+            cached = credential_cache.get(key)
+            if cached is None:
+                continue
+            auth_header = f"L402 {cached.macaroon}:{cached.preimage}"
+            kwargs["headers"] = {**req_headers, "Authorization": auth_header}
+            response = await client.request(**kwargs)
+            kwargs["headers"] = req_headers
+            if response.status_code != 402:
+                return _toll_response(
+                    response,
+                    parse,
+                    paid=False,
+                    amount_sats=0,
+                    payment_hash=cached.payment_hash,
+                )
+            credential_cache.delete(key)
+
+    try:
+        challenge = _parse_challenge(response)
+        if not isinstance(challenge, dict):
             raise RuntimeError("lightning-toll/client: Could not parse 402 response body")
 
         invoice = challenge.get("invoice")
         macaroon = challenge.get("macaroon")
+        amount_sats = challenge.get("amountSats", 0)
+        payment_hash = challenge.get("paymentHash")
+        expires_at = challenge.get("expiresAt")
 
         if not invoice:
             raise RuntimeError("lightning-toll/client: 402 response missing invoice")
@@ -164,7 +323,6 @@ async def auto_pay(
             raise RuntimeError("lightning-toll/client: 402 response missing macaroon")
 
         # Check budget
-        amount_sats = challenge.get("amountSats", 0)
         if amount_sats > max_sats:
             raise RuntimeError(
                 f"lightning-toll/client: Price {amount_sats} sats exceeds budget of {max_sats} sats"
@@ -181,33 +339,37 @@ async def auto_pay(
 
         kwargs["headers"] = retry_headers
         retry_response = await client.request(**kwargs)
-
-        try:
-            resp_body = retry_response.json()
-        except Exception:
-            resp_body = retry_response.text
+        result = _toll_response(
+            retry_response,
+            parse,
+            paid=True,
+            amount_sats=amount_sats,
+            payment_hash=payment_hash,
+        )
 
         # Cache the credential for future requests
-        # Default expiry: 5 minutes (server may override via expiresAt in challenge)
-        payment_hash = challenge.get("paymentHash")
+        # Default expiry: 5 minutes (server may override via expiresAt in challenge).
+        # Deadlines are kept on the monotonic clock so wall-clock jumps don't
+        # shorten or extend a credential's life; the Unix expiry is kept for disk.
         if credential_cache is not None and retry_response.status_code < 400:
-            expiry_secs = challenge.get("expiresAt", time.time() + 300)
-            credential_cache[url] = CachedCredential(
+            wall_now = time.time()
+            ttl = expires_at - wall_now if expires_at is not None else 300
+            expiry = time.monotonic() + ttl
+            credential_cache.set(key, CachedCredential(
                 macaroon=macaroon,
                 preimage=pay_result.preimage,
-                expiry=expiry_secs,
+                expiry=expiry,
                 amount_sats=amount_sats,
                 payment_hash=payment_hash,
-            )
+                soft_expiry=expiry - refresh_before if refresh_before > 0 else None,
+                wall_expiry=wall_now + ttl,
+            ))
 
-        return TollResponse(
-            status_code=retry_response.status_code,
-            headers=dict(retry_response.headers),
-            body=resp_body,
-            paid=True,
-            amount_sats=amount_sats,
-            payment_hash=payment_hash,
-        )
+        return result
+    finally:
+        if leader is not None:
+            del inflight[key]
+            leader.set()
 
 
 class TollClient:
@@ -230,6 +392,9 @@ class TollClient:
         max_sats: int = 100,
         auto_retry: bool = True,
         headers: Optional[Dict[str, str]] = None,
+        credential_cache: Optional[CredentialCache] = None,
+        cache_dir: Optional[str] = None,
+        refresh_before: float = 0.0,
     ):
         """
         Initialize the TollClient.
@@ -240,6 +405,15 @@ class TollClient:
             max_sats: Budget cap per request.
             auto_retry: Auto-pay and retry on 402.
             headers: Default headers for all requests.
+            credential_cache: Credential cache to use, e.g. one shared with
+                other clients. Defaults to a private 1024-entry LRU.
+            cache_dir: Persist the private credential cache in this directory
+                so paid credentials survive restarts (requires diskcache).
+                Ignored when credential_cache is given.
+            refresh_before: Seconds before a cached credential expires at which
+                a GET/HEAD/OPTIONS fetch still uses it but also pays for a
+                replacement in the background, so requests never wait on a
+                payment once warm. 0 (default) disables background refresh.
         """
         if wallet is not None:
             self.wallet = wallet
@@ -250,10 +424,31 @@ class TollClient:
 
         self.max_sats = max_sats
         self.auto_retry = auto_retry
+        self.refresh_before = refresh_before
         self.default_headers = headers or {}
+        self._default_items = tuple(self.default_headers.items())
+
+        # Macaroon cache: method + origin + path -> CachedCredential
+        self._owns_cache = credential_cache is None
+        self._credential_cache = (
+            credential_cache
+            if credential_cache is not None
+            else CredentialCache(cache_dir=cache_dir)
+        )
 
-        # Macaroon cache: URL -> CachedCredential
-        self._credential_cache: Dict[str, CachedCredential] = {}
+        # In-flight payment flows: cache key -> Event set when the flow finishes
+        self._inflight: Dict[str, asyncio.Event] = {}
+        # Background refresh tasks (strong refs so they aren't garbage collected)
+        self._refresh_tasks: Set[asyncio.Task] = set()
+
+        # Pooled HTTP client, reused across fetches so keep-alive connections
+        # (and their TLS sessions) survive between the 402 and the paid retry.
+        # With HTTP/2 the retry is multiplexed onto the same connection.
+        self._http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=DEFAULT_LIMITS,
+            timeout=DEFAULT_TIMEOUT,
+        )
 
         # Track spending
         self.total_spent = 0
@@ -268,6 +463,7 @@ class TollClient:
         body: Any = None,
         max_sats: Optional[int] = None,
         auto_retry: Optional[bool] = None,
+        parse: str = "auto",
     ) -> TollResponse:
         """
         Fetch a URL with automatic L402 payment handling.
@@ -279,16 +475,37 @@ class TollClient:
             body: Request body.
             max_sats: Override budget cap for this request.
             auto_retry: Override auto-retry for this request.
+            parse: How to decode the response body ("auto", "json", "text"
+                or "bytes"); see auto_pay().
 
         Returns:
             TollResponse with status, headers, body, and payment info.
         """
         self.request_count += 1
 
-        merged_headers = {**self.default_headers, **(headers or {})}
+        merged_headers = dict(self._default_items)
+        if headers:
+            merged_headers.update(headers)
         effective_max = max_sats if max_sats is not None else self.max_sats
         effective_retry = auto_retry if auto_retry is not None else self.auto_retry
 
+        # Concurrent fetches that hit a 402 coalesce on one payment per
+        # endpoint inside auto_pay, via self._inflight
+        key = cache_key(method, url)
+        now = time.monotonic()
+        cached = self._credential_cache.get(key, now)
+        if (
+            effective_retry
+            and cached is not None
+            and cached.soft_expiry is not None
+            and cached.soft_expiry <= now
+            and key not in self._inflight
+            and method.upper() in REFRESHABLE_METHODS
+        ):
+            # Stale-while-revalidate: serve from the cached credential now and
+            # pay for its replacement off the request path
+            self._start_refresh(key, url, method, merged_headers, effective_max)
+
         result = await auto_pay(
             url=url,
             wallet=self.wallet,
@@ -298,13 +515,57 @@ class TollClient:
             max_sats=effective_max,
             auto_retry=effective_retry,
             credential_cache=self._credential_cache,
+            client=self._http,
+            refresh_before=self.refresh_before,
+            parse=parse,
+            inflight=self._inflight,
         )
 
+        self._track(result)
+        return result
+
+    def _track(self, result: TollResponse) -> None:
+        """Add a response's payment to the spending totals."""
         if result.paid:
             self.payment_count += 1
             self.total_spent += result.amount_sats
 
-        return result
+    def _start_refresh(
+        self,
+        key: str,
+        url: str,
+        method: str,
+        headers: Dict[str, str],
+        max_sats: int,
+    ) -> None:
+        """Pay for a replacement credential in a background task."""
+        # Registered before the task starts so concurrent fetches see it
+        done = self._inflight[key] = asyncio.Event()
+
+        async def _refresh() -> None:
+            try:
+                result = await auto_pay(
+                    url=url,
+                    wallet=self.wallet,
+                    method=method,
+                    headers=headers,
+                    max_sats=max_sats,
+                    credential_cache=self._credential_cache,
+                    client=self._http,
+                    bypass_cache=True,
+                    refresh_before=self.refresh_before,
+                )
+                self._track(result)
+            except Exception as e:
+                # The current credential stays in use until it expires
+                logger.warning("lightning-toll/client: Background refresh for %s failed: %s", key, e)
+            finally:
+                del self._inflight[key]
+                done.set()
+
+        task = asyncio.create_task(_refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
 
     def get_stats(self) -> Dict[str, Any]:
         """Get spending statistics."""
@@ -319,9 +580,22 @@ class TollClient:
         """Clear all cached credentials."""
         self._credential_cache.clear()
 
-    async def close(self) -> None:
-        """Close the wallet connection."""
-        if hasattr(self.wallet, "close"):
+    async def close(self, close_wallet: bool = True) -> None:
+        """
+        Close the HTTP client, the private credential cache and the wallet connection.
+
+        Args:
+            close_wallet: Also close the wallet; pass False when the caller
+                owns a wallet shared with other clients.
+        """
+        # Let in-flight refreshes finish rather than cancel them: a refresh
+        # cancelled after paying would lose the credential it paid for
+        if self._refresh_tasks:
+            await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        await self._http.aclose()
+        if self._owns_cache:
+            self._credential_cache.close()
+        if close_wallet and hasattr(self.wallet, "close"):
             await self.wallet.close()
 
 
@@ -372,3 +646,58 @@ async def toll_fetch(
     finally:
         if wallet_url and hasattr(wallet_instance, "close"):
             await wallet_instance.close()
+
+
+async def toll_fetch_many(
+    urls: Iterable[str],
+    wallet_url: Optional[str] = None,
+    wallet: Optional[Any] = None,
+    max_sats: int = 50,
+    method: str = "GET",
+    headers: Optional[Dict[str, str]] = None,
+    body: Any = None,
+    concurrency: int = 16,
+) -> List[TollResponse]:
+    """
+    Fetch several URLs concurrently with auto-payment.
+
+    Unlike calling toll_fetch in a loop, all requests share one wallet
+    connection, one pooled HTTP client and one credential cache, and
+    concurrent requests to the same endpoint pay a single invoice.
+
+    Args:
+        urls: URLs to fetch.
+        wallet_url: NWC connection string.
+        wallet: Pre-created wallet instance.
+        max_sats: Maximum sats to pay per request.
+        method: HTTP method.
+        headers: Request headers.
+        body: Request body.
+        concurrency: Maximum number of requests in flight at once.
+
+    Returns:
+        TollResponses in the same order as urls.
+    """
+    if wallet is not None:
+        wallet_instance = wallet
+    elif wallet_url:
+        wallet_instance = NwcWallet(wallet_url)
+    else:
+        raise ValueError("toll_fetch_many: wallet_url or wallet is required")
+
+    client = TollClient(wallet=wallet_instance, max_sats=max_sats, headers=headers)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded(url: str) -> TollResponse:
+        async with semaphore:
+            return await client.fetch(url, method=method, body=body)
+
+    tasks = [asyncio.ensure_future(_bounded(url)) for url in urls]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        # On failure, don't leave the remaining requests running
+        for task in tasks:
+            task.cancel()
+        # A caller-supplied wallet stays open for the caller to close
+        await client.close(close_wallet=bool(wallet_url))
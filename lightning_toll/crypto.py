@@ -1,36 +1,167 @@
 """
 NIP-04 encryption helpers for Nostr Wallet Connect (NWC).
 
-Uses coincurve (libsecp256k1) for ECDH and PyCryptodome for AES-256-CBC.
+Uses coincurve (libsecp256k1) for ECDH and cryptography (OpenSSL) for
+AES-256-CBC, which dispatches to AES-NI / ARMv8 crypto extensions.
 This implements the NIP-04 encryption standard used by NWC (NIP-47).
+
+At import, the CPU's AES/SHA instruction flags are checked once (Linux only)
+and a warning is logged if they are missing, since AES-CBC and the macaroon
+HMAC-SHA256 chain then run several times slower.
 """
 
 from __future__ import annotations
 
+import logging
 import os
-from base64 import b64decode, b64encode
+import platform
+from functools import lru_cache
+from typing import Dict, Optional, Union
 
 from coincurve import PrivateKey, PublicKey
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from ._compat import b64decode, b64encode
+
+try:
+    # coincurve's own cffi bindings to libsecp256k1, for the signing fast path
+    from coincurve import GLOBAL_CONTEXT
+    from coincurve._libsecp256k1 import ffi as _ffi, lib as _lib
+except ImportError:  # pragma: no cover - layout differs in other coincurve versions
+    _lib = None
+
+AES_BLOCK_BITS = 128
+
+logger = logging.getLogger(__name__)
+
+# /proc/cpuinfo flags for hardware AES and SHA-256, per architecture
+_CPU_FLAGS = {
+    "x86_64": {"aes": "aes", "sha": "sha_ni"},
+    "aarch64": {"aes": "aes", "sha": "sha2"},
+}
+
+
+def cpu_crypto_features() -> Dict[str, Optional[bool]]:
+    """
+    Report whether the CPU advertises hardware AES and SHA-256 instructions.
+
+    Returns:
+        {"aes": bool | None, "sha": bool | None}; None where it can't be
+        determined (non-Linux or unknown architecture).
+    """
+    wanted = _CPU_FLAGS.get(platform.machine().lower().replace("amd64", "x86_64"))
+    flags = set()
+    if wanted:
+        try:
+            with open("/proc/cpuinfo", encoding="ascii", errors="replace") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name.strip() in ("flags", "Features"):
+                        flags.update(value.split())
+                        break
+        except OSError:
+            pass
+    if not flags:
+        return {"aes": None, "sha": None}
+    return {feature: flag in flags for feature, flag in wanted.items()}
+
 
+def _warn_missing_cpu_features() -> None:
+    missing = [name for name, present in cpu_crypto_features().items() if present is False]
+    if missing:
+        logger.warning(
+            "lightning-toll: CPU lacks hardware %s instructions; NIP-04 encryption "
+            "and macaroon signing will be slower on this host",
+            "/".join(name.upper() for name in missing),
+        )
 
+
+_warn_missing_cpu_features()
+
+
+@lru_cache(maxsize=64)
+def _private_key(private_key_hex: str) -> PrivateKey:
+    """Parsed private key; coincurve keys are immutable, so sharing is safe."""
+    return PrivateKey(bytes.fromhex(private_key_hex))
+
+
+@lru_cache(maxsize=64)
+def _x_only_public_key(public_key_hex: str) -> PublicKey:
+    """Parsed peer key: NIP-04 uses the x-only pubkey, so add the 02 prefix."""
+    return PublicKey(b"\x02" + bytes.fromhex(public_key_hex))
+
+
+@lru_cache(maxsize=256)
 def get_public_key(private_key_hex: str) -> str:
     """
     Derive the Nostr public key (x-only, 32 bytes hex) from a private key.
 
+    Memoized, since service keys are long-lived.
+
     Args:
         private_key_hex: 32-byte hex-encoded private key.
 
     Returns:
         32-byte hex-encoded x-only public key.
     """
-    sk = PrivateKey(bytes.fromhex(private_key_hex))
+    sk = _private_key(private_key_hex)
     # coincurve gives compressed pubkey (33 bytes). Drop the prefix byte.
     compressed = sk.public_key.format(compressed=True)
     return compressed[1:].hex()
 
 
+class SchnorrSigner:
+    """
+    BIP-340 Schnorr signer for one long-lived key.
+
+    coincurve's PrivateKey.sign_schnorr re-derives the keypair (a scalar
+    multiplication) and verifies every signature it makes. This builds the
+    libsecp256k1 keypair once and calls secp256k1_schnorrsig_sign32 through
+    coincurve's private cffi bindings (pinned to the coincurve releases in
+    pyproject.toml). Instead of verifying each signature, the fast path signs
+    and verifies a test message once at construction, through the public
+    API. If the bindings are missing or the self-test fails, every call falls
+    back to PrivateKey.sign_schnorr.
+    """
+
+    def __init__(self, secret: bytes):
+        """
+        Args:
+            secret: 32-byte secret key.
+        """
+        self._key = PrivateKey(secret)
+        self._keypair = None
+        if _lib is not None:
+            try:
+                keypair = _ffi.new("secp256k1_keypair *")
+                if _lib.secp256k1_keypair_create(GLOBAL_CONTEXT.ctx, keypair, secret):
+                    self._keypair = keypair
+                    self._self_test()
+            except Exception:  # bindings changed shape; use the public API
+                self._keypair = None
+
+    def _self_test(self) -> None:
+        """Check one raw signature against the public verifier, or disable the fast path."""
+        message = bytes(32)
+        if not self._key.public_key_xonly.verify(self._sign_raw(message), message):
+            self._keypair = None
+
+    def _sign_raw(self, message: bytes) -> bytes:
+        signature = _ffi.new("unsigned char[64]")
+        if not _lib.secp256k1_schnorrsig_sign32(
+            GLOBAL_CONTEXT.ctx, signature, message, self._keypair, os.urandom(32)
+        ):
+            raise ValueError("Schnorr signing failed")
+        return bytes(_ffi.buffer(signature))
+
+    def sign_schnorr(self, message: bytes) -> bytes:
+        """Sign a 32-byte message hash, with fresh auxiliary randomness."""
+        if self._keypair is None or len(message) != 32:
+            return self._key.sign_schnorr(message)
+        return self._sign_raw(message)
+
+
 def compute_shared_secret(private_key_hex: str, public_key_hex: str) -> bytes:
     """
     Compute the NIP-04 shared secret via ECDH.
@@ -42,10 +173,8 @@ def compute_shared_secret(private_key_hex: str, public_key_hex: str) -> bytes:
     Returns:
         32-byte shared secret (x-coordinate of ECDH point).
     """
-    sk = PrivateKey(bytes.fromhex(private_key_hex))
-    # NIP-04 uses the x-only pubkey, so we need to add the 02 prefix
-    pk_bytes = b"\x02" + bytes.fromhex(public_key_hex)
-    pk = PublicKey(pk_bytes)
+    sk = _private_key(private_key_hex)
+    pk = _x_only_public_key(public_key_hex)
 
     # ECDH: multiply their pubkey by our privkey
     shared_point = pk.multiply(sk.secret)
@@ -54,24 +183,72 @@ def compute_shared_secret(private_key_hex: str, public_key_hex: str) -> bytes:
     return shared_x
 
 
-def nip04_encrypt(private_key_hex: str, public_key_hex: str, plaintext: str) -> str:
+@lru_cache(maxsize=1024)
+def _shared_secret_cached(private_key_hex: str, public_key_hex: str) -> bytes:
+    """Memoized compute_shared_secret: an NWC session reuses one key pair."""
+    return compute_shared_secret(private_key_hex, public_key_hex)
+
+
+def _shared_secret(private_key: Union[str, bytes], public_key: Union[str, bytes]) -> bytes:
+    """Look up the shared secret, normalizing byte keys to hex for the cache."""
+    if isinstance(private_key, bytes):
+        private_key = private_key.hex()
+    if isinstance(public_key, bytes):
+        public_key = public_key.hex()
+    return _shared_secret_cached(private_key, public_key)
+
+
+def clear_shared_secret_cache() -> None:
+    """Drop all cached shared secrets (e.g. after rotating keys)."""
+    _shared_secret_cached.cache_clear()
+
+
+def _aes_cbc_encrypt(key: bytes, iv: bytes, data: bytes) -> bytes:
+    """AES-CBC encrypt with PKCS7 padding."""
+    padder = padding.PKCS7(AES_BLOCK_BITS).padder()
+    padded = padder.update(data) + padder.finalize()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return encryptor.update(padded) + encryptor.finalize()
+
+
+def _aes_cbc_decrypt(key: bytes, iv: bytes, data: bytes) -> bytes:
+    """AES-CBC decrypt and strip PKCS7 padding (ValueError if invalid)."""
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    padded = decryptor.update(data) + decryptor.finalize()
+    unpadder = padding.PKCS7(AES_BLOCK_BITS).unpadder()
+    return unpadder.update(padded) + unpadder.finalize()
+
+
+def nip04_shared_secret(private_key_hex: str, public_key_hex: str) -> bytes:
     """
-    Encrypt a message using NIP-04 (AES-256-CBC with ECDH shared secret).
+    Get the NIP-04 shared secret for a key pair, for the *_with_key functions.
+
+    Callers talking to one peer can derive this once and skip the ECDH
+    lookup on every message.
 
     Args:
         private_key_hex: Our 32-byte hex-encoded private key.
         public_key_hex: Their 32-byte hex-encoded x-only public key.
+
+    Returns:
+        32-byte shared secret (AES-256 key).
+    """
+    return _shared_secret(private_key_hex, public_key_hex)
+
+
+def nip04_encrypt_with_key(shared_secret: bytes, plaintext: str) -> str:
+    """
+    Encrypt a message using NIP-04 with a precomputed shared secret.
+
+    Args:
+        shared_secret: 32-byte key from nip04_shared_secret().
         plaintext: Message to encrypt.
 
     Returns:
         NIP-04 formatted ciphertext: "<base64_ciphertext>?iv=<base64_iv>"
     """
-    shared_secret = compute_shared_secret(private_key_hex, public_key_hex)
-
     iv = os.urandom(16)
-    cipher = AES.new(shared_secret, AES.MODE_CBC, iv)
-    padded = pad(plaintext.encode("utf-8"), AES.block_size)
-    ciphertext = cipher.encrypt(padded)
+    ciphertext = _aes_cbc_encrypt(shared_secret, iv, plaintext.encode("utf-8"))
 
     ct_b64 = b64encode(ciphertext).decode("ascii")
     iv_b64 = b64encode(iv).decode("ascii")
@@ -79,9 +256,61 @@ def nip04_encrypt(private_key_hex: str, public_key_hex: str, plaintext: str) ->
     return f"{ct_b64}?iv={iv_b64}"
 
 
-def nip04_decrypt(private_key_hex: str, public_key_hex: str, encrypted: str) -> str:
+def nip04_decrypt_bytes_with_key(shared_secret: bytes, encrypted: str) -> bytes:
     """
-    Decrypt a NIP-04 encrypted message.
+    Decrypt a NIP-04 message to raw plaintext bytes with a precomputed shared secret.
+
+    Args:
+        shared_secret: 32-byte key from nip04_shared_secret().
+        encrypted: NIP-04 formatted ciphertext: "<base64_ciphertext>?iv=<base64_iv>"
+
+    Returns:
+        Decrypted plaintext bytes.
+    """
+    ct_b64, sep, iv_b64 = encrypted.partition("?iv=")
+    if not sep or "?iv=" in iv_b64:
+        raise ValueError("Invalid NIP-04 ciphertext format (expected '...?iv=...')")
+
+    ciphertext = b64decode(ct_b64)
+    iv = b64decode(iv_b64)
+
+    return _aes_cbc_decrypt(shared_secret, iv, ciphertext)
+
+
+def nip04_decrypt_with_key(shared_secret: bytes, encrypted: str) -> str:
+    """
+    Decrypt a NIP-04 message with a precomputed shared secret.
+
+    Args:
+        shared_secret: 32-byte key from nip04_shared_secret().
+        encrypted: NIP-04 formatted ciphertext: "<base64_ciphertext>?iv=<base64_iv>"
+
+    Returns:
+        Decrypted plaintext string.
+    """
+    return nip04_decrypt_bytes_with_key(shared_secret, encrypted).decode("utf-8")
+
+
+def nip04_encrypt(private_key_hex: str, public_key_hex: str, plaintext: str) -> str:
+    """
+    Encrypt a message using NIP-04 (AES-256-CBC with ECDH shared secret).
+
+    Args:
+        private_key_hex: Our 32-byte hex-encoded private key.
+        public_key_hex: Their 32-byte hex-encoded x-only public key.
+        plaintext: Message to encrypt.
+
+    Returns:
+        NIP-04 formatted ciphertext: "<base64_ciphertext>?iv=<base64_iv>"
+    """
+    return nip04_encrypt_with_key(_shared_secret(private_key_hex, public_key_hex), plaintext)
+
+
+def nip04_decrypt_bytes(private_key_hex: str, public_key_hex: str, encrypted: str) -> bytes:
+    """
+    Decrypt a NIP-04 encrypted message to its raw UTF-8 plaintext bytes.
+
+    For callers that parse the plaintext as JSON straight from bytes.
 
     Args:
         private_key_hex: Our 32-byte hex-encoded private key.
@@ -89,19 +318,21 @@ def nip04_decrypt(private_key_hex: str, public_key_hex: str, encrypted: str) ->
         encrypted: NIP-04 formatted ciphertext: "<base64_ciphertext>?iv=<base64_iv>"
 
     Returns:
-        Decrypted plaintext string.
+        Decrypted plaintext bytes.
     """
-    shared_secret = compute_shared_secret(private_key_hex, public_key_hex)
+    return nip04_decrypt_bytes_with_key(_shared_secret(private_key_hex, public_key_hex), encrypted)
 
-    parts = encrypted.split("?iv=")
-    if len(parts) != 2:
-        raise ValueError("Invalid NIP-04 ciphertext format (expected '...?iv=...')")
 
-    ciphertext = b64decode(parts[0])
-    iv = b64decode(parts[1])
+def nip04_decrypt(private_key_hex: str, public_key_hex: str, encrypted: str) -> str:
+    """
+    Decrypt a NIP-04 encrypted message.
 
-    cipher = AES.new(shared_secret, AES.MODE_CBC, iv)
-    padded = cipher.decrypt(ciphertext)
-    plaintext = unpad(padded, AES.block_size)
+    Args:
+        private_key_hex: Our 32-byte hex-encoded private key.
+        public_key_hex: Their 32-byte hex-encoded x-only public key.
+        encrypted: NIP-04 formatted ciphertext: "<base64_ciphertext>?iv=<base64_iv>"
 
-    return plaintext.decode("utf-8")
+    Returns:
+        Decrypted plaintext string.
+    """
+    return nip04_decrypt_bytes(private_key_hex, public_key_hex, encrypted).decode("utf-8")
@@ -15,8 +15,10 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
+from ._compat import DATACLASS_SLOTS
 
-@dataclass
+
+@dataclass(**DATACLASS_SLOTS)
 class L402Credentials:
     """Parsed L402 authorization credentials."""
     macaroon: str
@@ -91,18 +93,15 @@ def parse_authorization(auth_header: Optional[str]) -> Optional[L402Credentials]
 
     trimmed = auth_header.strip()
 
-    # Check for L402 prefix (case-insensitive)
-    if not trimmed.lower().startswith("l402 "):
-        return None
-
-    credentials = trimmed[5:].strip()
-    colon_idx = credentials.find(":")
-    if colon_idx == -1:
+    # Check for L402 prefix (case-insensitive), lowering only the prefix
+    if trimmed[:5].lower() != "l402 ":
         return None
 
-    macaroon = credentials[:colon_idx]
-    preimage = credentials[colon_idx + 1:]
+    # Already right-stripped above. Plain str methods beat a regex here: they
+    # run in C with no match object, and this is on every paid request.
+    macaroon, _, preimage = trimmed[5:].lstrip().partition(":")
 
+    # A missing colon leaves preimage empty
     if not macaroon or not preimage:
         return None
 
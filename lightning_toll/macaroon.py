@@ -16,11 +16,21 @@ from __future__ import annotations
 
 import hashlib
 import hmac
-import json
 import time
-from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from ._compat import json_dumps, json_loads, urlsafe_b64decode, urlsafe_b64encode
+
+
+def _fromhex(value: Any) -> Optional[bytes]:
+    """bytes.fromhex, or None if value is not a hex string."""
+    try:
+        return bytes.fromhex(value)
+    except (TypeError, ValueError):
+        return None
 
 
 @dataclass
@@ -30,6 +40,27 @@ class Macaroon:
     caveats: List[str]             # e.g. ["expires_at = 123", "endpoint = /api/x"]
     signature: str                 # hex-encoded HMAC chain result
     raw: str = ""                  # base64url-encoded JSON (the wire format)
+    # (hex, bytes) pairs caching the binary forms; reused only while the hex is unchanged
+    _id_bytes: Optional[Tuple[str, Optional[bytes]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _signature_bytes: Optional[Tuple[str, Optional[bytes]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @property
+    def id_bytes(self) -> Optional[bytes]:
+        """Payment hash as bytes, or None if id is not valid hex."""
+        if self._id_bytes is None or self._id_bytes[0] is not self.id:
+            self._id_bytes = (self.id, _fromhex(self.id))
+        return self._id_bytes[1]
+
+    @property
+    def signature_bytes(self) -> Optional[bytes]:
+        """Signature as bytes, or None if signature is not valid hex."""
+        if self._signature_bytes is None or self._signature_bytes[0] is not self.signature:
+            self._signature_bytes = (self.signature, _fromhex(self.signature))
+        return self._signature_bytes[1]
 
 
 @dataclass
@@ -40,12 +71,87 @@ class VerifyResult:
     payment_hash: Optional[str] = None
 
 
-def create_macaroon(secret: str, **opts: Any) -> Macaroon:
+# HMAC-SHA256 pads (RFC 2104) as translate tables, for keys up to one block
+_SHA256_BLOCK = 64
+_IPAD = bytes(b ^ 0x36 for b in range(256))
+_OPAD = bytes(b ^ 0x5C for b in range(256))
+
+
+@lru_cache(maxsize=4)
+def _secret_pads(secret: Union[str, bytes]) -> Tuple[Any, Any]:
+    """
+    Inner and outer SHA-256 states with the padded server secret absorbed.
+
+    Built once per secret; copy() them to skip the key setup per macaroon.
+    Cheaper than copying an hmac.HMAC, which wraps the same two states.
+    Keyed on the secret as given, so a str secret is UTF-8 encoded only here.
+    """
+    key = secret.encode("utf-8") if isinstance(secret, str) else secret
+    if len(key) > _SHA256_BLOCK:
+        key = hashlib.sha256(key).digest()
+    key = key.ljust(_SHA256_BLOCK, b"\0")
+    return hashlib.sha256(key.translate(_IPAD)), hashlib.sha256(key.translate(_OPAD))
+
+
+@lru_cache(maxsize=4)
+def _secret_digest(secret: Union[str, bytes]) -> bytes:
+    """
+    128-bit blake2b digest standing in for the secret in cache keys.
+
+    Keeps _verified_signatures keys small and fixed-size however long the
+    secret is. This is not a way to keep the secret out of memory: it stays
+    in this cache, in _secret_pads and _mint, as it does with the caller.
+    """
+    key = secret.encode("utf-8") if isinstance(secret, str) else secret
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+
+def _root_signature(secret: Union[str, bytes], identifier: str) -> bytes:
+    """Compute HMAC(secret, identifier), the start of the signature chain."""
+    inner_pad, outer_pad = _secret_pads(secret)
+    inner = inner_pad.copy()
+    inner.update(identifier.encode("utf-8"))
+    outer = outer_pad.copy()
+    outer.update(inner.digest())
+    return outer.digest()
+
+
+def _hmac_sha256(key: bytes, msg: bytes) -> bytes:
+    """
+    HMAC-SHA256 for a key of at most 64 bytes, built directly on hashlib.
+
+    Each caveat is folded with the previous 32-byte signature as key, so the
+    key never needs hashing down and the pads are a single translate().
+    """
+    key = key.ljust(_SHA256_BLOCK, b"\0")
+    inner = hashlib.sha256(key.translate(_IPAD) + msg).digest()
+    return hashlib.sha256(key.translate(_OPAD) + inner).digest()
+
+
+# Expected signatures by (secret digest, id, caveats) for macaroons that
+# verified. Clients replay one macaroon until it expires, so a repeat
+# verification is a dict lookup plus compare_digest; caveats are still
+# checked per request against the live context. Secrets are told apart by
+# their _secret_digest.
+VERIFIED_CACHE_SIZE = 1024
+_verified_signatures: "OrderedDict[Tuple[bytes, str, Tuple[str, ...]], bytes]" = OrderedDict()
+
+
+def clear_verified_cache() -> None:
+    """Forget all verified signatures (e.g. after rotating the secret)."""
+    _verified_signatures.clear()
+
+
+# Caveat options in the order the Node.js version emits them
+_CAVEAT_ORDER = ("expires_at", "endpoint", "method", "ip")
+
+
+def create_macaroon(secret: Union[str, bytes], **opts: Any) -> Macaroon:
     """
     Create a new macaroon.
 
     Args:
-        secret: Server's HMAC secret.
+        secret: Server's HMAC secret (str, UTF-8 encoded, or bytes).
         payment_hash: Lightning payment hash (required).
         expires_at: Unix timestamp for expiry.
         endpoint: Bound endpoint path.
@@ -64,77 +170,158 @@ def create_macaroon(secret: str, **opts: Any) -> Macaroon:
 
     identifier = payment_hash
 
-    # Build caveats (same order as Node.js version)
-    caveats: List[str] = []
-    if opts.get("expires_at"):
-        caveats.append(f"expires_at = {opts['expires_at']}")
-    if opts.get("endpoint"):
-        caveats.append(f"endpoint = {opts['endpoint']}")
-    if opts.get("method"):
-        caveats.append(f"method = {opts['method']}")
-    if opts.get("ip"):
-        caveats.append(f"ip = {opts['ip']}")
+    # Build caveats (same order as Node.js version); a tuple keys the mint cache
+    caveats = tuple(f"{key} = {opts[key]}" for key in _CAVEAT_ORDER if opts.get(key))
+
+    signature, sig, raw = _mint(secret, identifier, caveats)
+
+    macaroon = Macaroon(id=identifier, caveats=list(caveats), signature=signature, raw=raw)
+    macaroon._signature_bytes = (signature, sig)
+    return macaroon
+
+
+@lru_cache(maxsize=256)
+def _mint(secret: Any, identifier: str, caveats: Tuple[str, ...]) -> Tuple[str, bytes, str]:
+    """
+    Sign and encode a macaroon, returning (signature hex, signature, raw).
 
+    Memoized: minting is deterministic, and re-issuing a challenge for the
+    same invoice and expiry then skips the HMAC chain and encoding.
+    """
     # Chain HMAC: start with HMAC(secret, id), then fold each caveat
-    sig = hmac.new(
-        secret.encode("utf-8") if isinstance(secret, str) else secret,
-        identifier.encode("utf-8"),
-        hashlib.sha256,
-    ).digest()
+    sig = _root_signature(secret, identifier)
 
     for caveat in caveats:
-        sig = hmac.new(sig, caveat.encode("utf-8"), hashlib.sha256).digest()
+        sig = _hmac_sha256(sig, caveat.encode("utf-8"))
 
     signature = sig.hex()
 
     # Encode as base64url JSON for transport (same format as Node.js)
-    payload = {"id": identifier, "caveats": caveats, "signature": signature}
-    raw = urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8")).decode("ascii")
-    # Strip padding to match base64url (Node.js base64url doesn't pad)
-    raw = raw.rstrip("=")
-
-    return Macaroon(id=identifier, caveats=caveats, signature=signature, raw=raw)
+    payload = {"id": identifier, "caveats": list(caveats), "signature": signature}
+    # JSON bytes go straight into base64; padding is stripped before the single
+    # decode to str, to match base64url (Node.js base64url doesn't pad)
+    raw = urlsafe_b64encode(json_dumps(payload)).rstrip(b"=").decode("ascii")
+    return signature, sig, raw
 
 
 def decode_macaroon(raw: str) -> Optional[Macaroon]:
     """
     Decode a raw macaroon string back to its components.
 
+    Decoding is memoized on the raw string, since clients replay the same
+    macaroon on every request until it expires. Caveats are still checked
+    per request by verify_macaroon().
+
     Args:
         raw: Base64url-encoded macaroon string.
 
     Returns:
         Macaroon or None if decoding fails.
     """
+    if not isinstance(raw, str):
+        return None
+    decoded = _decode_macaroon_cached(raw)
+    if decoded is None:
+        return None
+    identifier, caveats, signature, id_bytes, signature_bytes = decoded
+    macaroon = Macaroon(id=identifier, caveats=list(caveats), signature=signature, raw=raw)
+    macaroon._id_bytes = (identifier, id_bytes)
+    macaroon._signature_bytes = (signature, signature_bytes)
+    return macaroon
+
+
+@lru_cache(maxsize=4096)
+def _decode_macaroon_cached(raw: str) -> Optional[Tuple[Any, ...]]:
+    """Decode to an immutable (id, caveats, signature, id_bytes, signature_bytes) tuple, or None."""
     try:
         # Add padding back if needed
         padded = raw + "=" * (-len(raw) % 4)
         json_bytes = urlsafe_b64decode(padded)
-        parsed = json.loads(json_bytes.decode("utf-8"))
+        # Cheap rejects for garbage before the JSON parse. Key order and
+        # spacing vary between encoders, so only look for the required keys.
+        if (
+            not json_bytes.lstrip().startswith(b"{")
+            or b'"signature"' not in json_bytes
+            or b'"id"' not in json_bytes
+        ):
+            return None
+        parsed = json_loads(json_bytes)
 
         if not parsed.get("id") or not parsed.get("signature") or not isinstance(parsed.get("caveats"), list):
             return None
 
-        return Macaroon(
-            id=parsed["id"],
-            caveats=parsed["caveats"],
-            signature=parsed["signature"],
-            raw=raw,
-        )
+        identifier = parsed["id"]
+        signature = parsed["signature"]
+        return identifier, tuple(parsed["caveats"]), signature, _fromhex(identifier), _fromhex(signature)
     except Exception:
         return None
 
 
+@lru_cache(maxsize=4096)
+def _parse_caveat(caveat: str) -> Optional[Tuple[str, str]]:
+    """
+    Split "key = value" once per distinct caveat string, or None if malformed.
+
+    Method values come back upper-cased, so the per-request check only has
+    to normalize the request's method (and usually not even that).
+    """
+    parts = caveat.split(" = ", 1)
+    if len(parts) != 2:
+        return None
+    key, value = parts[0].strip(), parts[1].strip()
+    if key == "method":
+        value = value.upper()
+    return key, value
+
+
+def _check_expires_at(value: str, context: Dict[str, str]) -> Optional[str]:
+    if time.time() > int(value):
+        return "Macaroon expired"
+    return None
+
+
+def _check_endpoint(value: str, context: Dict[str, str]) -> Optional[str]:
+    if context.get("endpoint") and context["endpoint"] != value:
+        return f"Endpoint mismatch: expected {value}, got {context['endpoint']}"
+    return None
+
+
+def _check_method(value: str, context: Dict[str, str]) -> Optional[str]:
+    method = context.get("method")
+    # Servers pass upper-case methods already; only fold case when they differ
+    if method and method != value and method.upper() != value:
+        return f"Method mismatch: expected {value}, got {method}"
+    return None
+
+
+def _check_ip(value: str, context: Dict[str, str]) -> Optional[str]:
+    if context.get("ip") and context["ip"] != value:
+        return f"IP mismatch: expected {value}, got {context['ip']}"
+    return None
+
+
+# Caveat key → check(value, context) returning an error message or None
+_CAVEAT_CHECKS: Dict[str, Callable[[str, Dict[str, str]], Optional[str]]] = {
+    "expires_at": _check_expires_at,
+    "endpoint": _check_endpoint,
+    "method": _check_method,
+    "ip": _check_ip,
+}
+
+
 def verify_macaroon(
-    secret: str,
+    secret: Union[str, bytes],
     macaroon: Macaroon,
     context: Optional[Dict[str, str]] = None,
 ) -> VerifyResult:
     """
     Verify a macaroon's signature and caveats.
 
+    The expected signature of a macaroon that verified once is kept in a
+    bounded LRU, so replays skip the HMAC chain; caveats always run.
+
     Args:
-        secret: Server's HMAC secret.
+        secret: Server's HMAC secret (str, UTF-8 encoded, or bytes).
         macaroon: Decoded macaroon to verify.
         context: Request context for caveat verification.
             - endpoint: Current request path.
@@ -150,79 +337,190 @@ def verify_macaroon(
     if not macaroon or not macaroon.id or not macaroon.signature:
         return VerifyResult(valid=False, error="Invalid macaroon structure", payment_hash=None)
 
-    # Recompute chained HMAC
-    sig = hmac.new(
-        secret.encode("utf-8") if isinstance(secret, str) else secret,
-        macaroon.id.encode("utf-8"),
-        hashlib.sha256,
-    ).digest()
+    return _verify_fields(
+        secret, macaroon.id, tuple(macaroon.caveats), macaroon.signature_bytes, context
+    )
 
-    for caveat in macaroon.caveats:
-        sig = hmac.new(sig, caveat.encode("utf-8"), hashlib.sha256).digest()
 
-    expected_sig = sig.hex()
+def verify_macaroon_raw(
+    secret: Union[str, bytes],
+    raw: str,
+    preimage: str,
+    context: Optional[Dict[str, str]] = None,
+) -> VerifyResult:
+    """
+    Decode and verify a wire-format macaroon together with its preimage.
 
-    # Constant-time comparison
-    if not hmac.compare_digest(
-        bytes.fromhex(macaroon.signature),
-        bytes.fromhex(expected_sig),
-    ):
-        return VerifyResult(valid=False, error="Invalid macaroon signature", payment_hash=macaroon.id)
+    Equivalent to decode_macaroon + verify_macaroon + verify_preimage, but
+    works from the memoized decode directly without building a Macaroon.
+    This is what the toll middleware runs for each L402 credential.
+
+    Args:
+        secret: Server's HMAC secret (str, UTF-8 encoded, or bytes).
+        raw: Base64url-encoded macaroon string.
+        preimage: Hex-encoded payment preimage presented with it.
+        context: Request context for caveat verification (see verify_macaroon).
+
+    Returns:
+        VerifyResult with valid flag, optional error, and payment_hash.
+    """
+    decoded = _decode_macaroon_cached(raw) if isinstance(raw, str) else None
+    if decoded is None:
+        return VerifyResult(valid=False, error="Invalid macaroon", payment_hash=None)
+
+    identifier, caveats, _, id_bytes, signature_bytes = decoded
+    result = _verify_fields(secret, identifier, caveats, signature_bytes, context or {})
+    if result.valid and not verify_preimage(preimage, id_bytes):
+        return VerifyResult(
+            valid=False,
+            error="Invalid preimage — does not match payment hash",
+            payment_hash=identifier,
+        )
+    return result
+
+
+def _verify_fields(
+    secret: Union[str, bytes],
+    identifier: str,
+    caveats: Tuple[str, ...],
+    presented: Optional[bytes],
+    context: Dict[str, str],
+) -> VerifyResult:
+    """Check the signature chain and caveats of a macaroon's decoded fields."""
+    if not _signature_matches(secret, _secret_digest(secret), identifier, caveats, presented):
+        return VerifyResult(valid=False, error="Invalid macaroon signature", payment_hash=identifier)
 
     # Verify caveats
-    for caveat in macaroon.caveats:
-        parts = caveat.split(" = ", 1)
-        if len(parts) != 2:
-            return VerifyResult(
-                valid=False,
-                error=f"Malformed caveat: {caveat}",
-                payment_hash=macaroon.id,
-            )
+    for caveat in caveats:
+        error = _caveat_error(caveat, context)
+        if error:
+            return VerifyResult(valid=False, error=error, payment_hash=identifier)
+
+    return VerifyResult(valid=True, payment_hash=identifier)
+
+
+def _signature_matches(
+    secret: Union[str, bytes],
+    secret_digest: bytes,
+    identifier: str,
+    caveats: Tuple[str, ...],
+    presented: Optional[bytes],
+) -> bool:
+    """Compare a presented signature with the chain, using the verified cache."""
+    if presented is None:
+        return False
 
-        key = parts[0].strip()
-        value = parts[1].strip()
+    # The key covers everything the chain depends on, so a cached signature
+    # can't vouch for different caveats
+    cache_key = (secret_digest, identifier, caveats)
+    expected = _verified_signatures.get(cache_key)
+    if expected is not None:
+        try:
+            _verified_signatures.move_to_end(cache_key)
+        except KeyError:
+            # Evicted by another thread since the get(); verify as a miss
+            expected = None
+    cached = expected is not None
+    if not cached:
+        # Recompute chained HMAC
+        expected = _root_signature(secret, identifier)
+
+        for caveat in caveats:
+            expected = _hmac_sha256(expected, caveat.encode("utf-8"))
 
-        if key == "expires_at":
-            expires_at = int(value)
-            if time.time() > expires_at:
-                return VerifyResult(valid=False, error="Macaroon expired", payment_hash=macaroon.id)
+    # Constant-time comparison
+    if not hmac.compare_digest(presented, expected):
+        return False
 
-        elif key == "endpoint":
-            if context.get("endpoint") and context["endpoint"] != value:
-                return VerifyResult(
-                    valid=False,
-                    error=f"Endpoint mismatch: expected {value}, got {context['endpoint']}",
-                    payment_hash=macaroon.id,
-                )
+    # Only chains that matched are remembered, so forgeries can't evict them
+    if not cached:
+        _verified_signatures[cache_key] = expected
+        if len(_verified_signatures) > VERIFIED_CACHE_SIZE:
+            try:
+                _verified_signatures.popitem(last=False)
+            except KeyError:  # emptied by another thread
+                pass
+    return True
+
+
+def _caveat_error(caveat: str, context: Dict[str, str]) -> Optional[str]:
+    """Check one caveat against the request context; an error message or None."""
+    parsed = _parse_caveat(caveat)
+    if parsed is None:
+        return f"Malformed caveat: {caveat}"
+
+    key, value = parsed
+    check = _CAVEAT_CHECKS.get(key)
+    # Unknown caveats are ignored (forward-compatible)
+    if check is None:
+        return None
+    return check(value, context)
 
-        elif key == "method":
-            if context.get("method") and context["method"].upper() != value.upper():
-                return VerifyResult(
-                    valid=False,
-                    error=f"Method mismatch: expected {value}, got {context['method']}",
-                    payment_hash=macaroon.id,
-                )
 
-        elif key == "ip":
-            if context.get("ip") and context["ip"] != value:
-                return VerifyResult(
-                    valid=False,
-                    error=f"IP mismatch: expected {value}, got {context['ip']}",
-                    payment_hash=macaroon.id,
-                )
-        # else: unknown caveats are ignored (forward-compatible)
+def verify_macaroons(
+    secret: Union[str, bytes],
+    macaroons: Iterable[Macaroon],
+    context: Optional[Dict[str, str]] = None,
+) -> List[VerifyResult]:
+    """
+    Verify several macaroons against the same secret and request context.
 
-    return VerifyResult(valid=True, payment_hash=macaroon.id)
+    Same results as calling verify_macaroon on each, but the secret digest
+    is looked up once, and each distinct caveat is checked against the
+    context once for the whole batch. Tokens minted for one endpoint share
+    their caveats, so most caveat checks become a dict lookup. expires_at
+    is therefore judged at a single instant for every token.
 
+    Args:
+        secret: Server's HMAC secret (str, UTF-8 encoded, or bytes).
+        macaroons: Decoded macaroons to verify.
+        context: Request context for caveat verification (see verify_macaroon).
 
-def verify_preimage(preimage: str, payment_hash: str) -> bool:
+    Returns:
+        One VerifyResult per macaroon, in order.
+    """
+    if context is None:
+        context = {}
+    secret_digest = _secret_digest(secret)
+    # Caveat string → error or None, valid only for this context
+    caveat_errors: Dict[str, Optional[str]] = {}
+
+    results = []
+    for macaroon in macaroons:
+        if not macaroon or not macaroon.id or not macaroon.signature:
+            results.append(VerifyResult(valid=False, error="Invalid macaroon structure", payment_hash=None))
+            continue
+
+        identifier = macaroon.id
+        caveats = tuple(macaroon.caveats)
+        if not _signature_matches(secret, secret_digest, identifier, caveats, macaroon.signature_bytes):
+            results.append(
+                VerifyResult(valid=False, error="Invalid macaroon signature", payment_hash=identifier)
+            )
+            continue
+
+        result = VerifyResult(valid=True, payment_hash=identifier)
+        for caveat in caveats:
+            if caveat in caveat_errors:
+                error = caveat_errors[caveat]
+            else:
+                error = caveat_errors[caveat] = _caveat_error(caveat, context)
+            if error:
+                result = VerifyResult(valid=False, error=error, payment_hash=identifier)
+                break
+        results.append(result)
+    return results
+
+
+def verify_preimage(preimage: str, payment_hash: Union[str, bytes, None]) -> bool:
     """
     Verify that a preimage matches a payment hash.
     payment_hash = SHA256(preimage)
 
     Args:
         preimage: Hex-encoded preimage.
-        payment_hash: Hex-encoded payment hash.
+        payment_hash: Hex-encoded payment hash, or its raw bytes
+            (e.g. Macaroon.id_bytes).
 
     Returns:
         True if SHA256(preimage) == payment_hash.
@@ -230,10 +528,10 @@ def verify_preimage(preimage: str, payment_hash: str) -> bool:
     if not preimage or not payment_hash:
         return False
     try:
-        computed = hashlib.sha256(bytes.fromhex(preimage)).hexdigest()
-        return hmac.compare_digest(
-            bytes.fromhex(computed),
-            bytes.fromhex(payment_hash),
-        )
-    except Exception:
+        if isinstance(payment_hash, str):
+            payment_hash = bytes.fromhex(payment_hash)
+        computed = hashlib.sha256(bytes.fromhex(preimage)).digest()
+        # Constant-time over the raw 32-byte digests, never the hex strings
+        return hmac.compare_digest(computed, payment_hash)
+    except (TypeError, ValueError):
         return False
@@ -10,20 +10,21 @@ Direct port of the Node.js lightning-toll middleware.js.
 from __future__ import annotations
 
 import asyncio
-import re
 import time
-from typing import Any, Callable, Dict, Optional, Union
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from .l402 import format_challenge, format_challenge_body, parse_authorization
-from .macaroon import (
-    create_macaroon,
-    decode_macaroon,
-    verify_macaroon,
-    verify_preimage,
-)
+from .macaroon import create_macaroon, verify_macaroon_raw
 from .stats import TollStats
 
 
+# Clients tracked per route for the free tier; the least recently seen are dropped
+FREE_TIER_MAX_CLIENTS = 100_000
+
+_WINDOW_UNITS = (("ms", 1), ("s", 1000), ("m", 60000), ("h", 3600000), ("d", 86400000))
+
+
 def parse_window(window: Union[str, int, None]) -> int:
     """
     Parse a time window string like '1h', '30m', '1d' to milliseconds.
@@ -39,14 +40,13 @@ def parse_window(window: Union[str, int, None]) -> int:
     if not window or not isinstance(window, str):
         return 3600000  # default 1h
 
-    match = re.match(r"^(\d+)(ms|s|m|h|d)$", window)
-    if not match:
-        return 3600000
-
-    num = int(match.group(1))
-    unit = match.group(2)
-    multipliers = {"ms": 1, "s": 1000, "m": 60000, "h": 3600000, "d": 86400000}
-    return num * multipliers.get(unit, 3600000)
+    # Plain string ops instead of a regex; "ms" must be tried before "s"/"m"
+    for unit, multiplier in _WINDOW_UNITS:
+        if window.endswith(unit):
+            num = window[: -len(unit)]
+            if num.isdecimal():
+                return int(num) * multiplier
+    return 3600000
 
 
 def get_client_id(request: Any) -> str:
@@ -74,6 +74,38 @@ def get_client_id(request: Any) -> str:
     return "unknown"
 
 
+async def _monitor_payment(
+    wallet: Any,
+    payment_hash: str,
+    invoice_expiry: int,
+    on_payment: Callable,
+    info: Dict[str, Any],
+) -> None:
+    """
+    Wait for an issued invoice to be paid and report it to on_payment.
+
+    Args:
+        wallet: Wallet that issued the invoice.
+        payment_hash: Payment hash of the invoice.
+        invoice_expiry: Invoice expiry in seconds (how long to wait).
+        on_payment: Callback receiving the payment info dict.
+        info: Request details (payment_hash, amount_sats, endpoint, client_id).
+    """
+    try:
+        result = await wallet.wait_for_payment(payment_hash, timeout_ms=invoice_expiry * 1000)
+        if result.paid:
+            try:
+                on_payment({
+                    **info,
+                    "preimage": result.preimage,
+                    "settled_at": result.settled_at,
+                })
+            except Exception:
+                pass  # Don't crash on callback errors
+    except Exception:
+        pass  # Timeout or error — ignore
+
+
 class TollMiddleware:
     """
     Core toll gate logic for a specific route configuration.
@@ -85,20 +117,28 @@ class TollMiddleware:
         self.config = config
         self.route_opts = route_opts
 
-        # Free tier tracking: client_id → { count, window_start }
-        self._free_tier_map: Dict[str, Dict[str, Any]] = {}
+        # Free tier tracking: client_id → [count, window_start_ns], bounded LRU
+        self._free_tier_map: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._free_tier_max = FREE_TIER_MAX_CLIENTS
         self._free_requests = route_opts.get("free_requests", 0)
         self._free_window_ms = parse_window(route_opts.get("free_window", "1h"))
+        self._free_window_ns = self._free_window_ms * 1_000_000
+
+        # Pricing and caveat binding are fixed once the route is declared, so
+        # settle them here rather than re-deciding on every request
+        price_fn = route_opts.get("price")
+        sats = route_opts.get("sats")
+        self._price_fn: Optional[Callable[[Any], int]] = price_fn if callable(price_fn) else None
+        self._fixed_price: int = sats if isinstance(sats, int) else config["default_sats"]
+        self._bind_endpoint: bool = config["bind_endpoint"]
+        self._bind_method: bool = config["bind_method"]
+        self._bind_ip: bool = config["bind_ip"]
 
     def _resolve_price(self, request: Any) -> int:
         """Resolve the price for this request."""
-        price_fn = self.route_opts.get("price")
-        if callable(price_fn):
-            return price_fn(request)
-        sats = self.route_opts.get("sats")
-        if isinstance(sats, int):
-            return sats
-        return self.config["default_sats"]
+        if self._price_fn is not None:
+            return self._price_fn(request)
+        return self._fixed_price
 
     def _resolve_description(self, request: Any) -> str:
         """Resolve the description for this request."""
@@ -114,15 +154,22 @@ class TollMiddleware:
         if self._free_requests <= 0:
             return False
 
-        now = time.time() * 1000  # ms
+        now = time.monotonic_ns()
         entry = self._free_tier_map.get(client_id)
 
-        if not entry or (now - entry["window_start"]) > self._free_window_ms:
-            entry = {"count": 0, "window_start": now}
-            self._free_tier_map[client_id] = entry
-
-        if entry["count"] < self._free_requests:
-            entry["count"] += 1
+        if entry is None:
+            entry = self._free_tier_map[client_id] = [0, now]
+            if len(self._free_tier_map) > self._free_tier_max:
+                self._free_tier_map.popitem(last=False)
+        else:
+            self._free_tier_map.move_to_end(client_id)
+            if (now - entry[1]) > self._free_window_ns:
+                # New window: reset in place rather than allocating a new entry
+                entry[0] = 0
+                entry[1] = now
+
+        if entry[0] < self._free_requests:
+            entry[0] += 1
             return True
 
         return False
@@ -153,49 +200,41 @@ class TollMiddleware:
         stats: TollStats = self.config["stats"]
         invoice_expiry = self.config["invoice_expiry"]
         macaroon_expiry = self.config["macaroon_expiry"]
-        bind_endpoint = self.config["bind_endpoint"]
-        bind_method = self.config["bind_method"]
-        bind_ip = self.config["bind_ip"]
         on_payment = self.config.get("on_payment")
 
         # Check for existing L402 authorization
         auth_header = request.headers.get("authorization")
-        l402_creds = parse_authorization(auth_header)
+        # Cheap gate for the common unauthenticated (402) path before full parsing
+        if auth_header and auth_header.lstrip()[:5].lower() == "l402 ":
+            l402_creds = parse_authorization(auth_header)
+        else:
+            l402_creds = None
+
+        # Caveat values this route binds: checked against presented macaroons
+        # and embedded in newly issued ones
+        context: Dict[str, str] = {}
+        if self._bind_endpoint:
+            context["endpoint"] = endpoint
+        if self._bind_method:
+            context["method"] = request.method
+        if self._bind_ip:
+            context["ip"] = client_id
 
         if l402_creds:
-            # Client is presenting credentials — verify them
-            decoded = decode_macaroon(l402_creds.macaroon)
-            if not decoded:
-                raise HTTPException(status_code=401, detail={"error": "Invalid macaroon"})
-
-            # Verify macaroon signature and caveats
-            context = {}
-            if bind_endpoint:
-                context["endpoint"] = endpoint
-            if bind_method:
-                context["method"] = request.method
-            if bind_ip:
-                context["ip"] = client_id
-
-            mac_result = verify_macaroon(secret, decoded, context)
+            # Client is presenting credentials — decode and verify the
+            # macaroon's signature and caveats, then the preimage, in one pass
+            mac_result = verify_macaroon_raw(secret, l402_creds.macaroon, l402_creds.preimage, context)
             if not mac_result.valid:
                 raise HTTPException(status_code=401, detail={"error": mac_result.error})
 
-            # Verify preimage matches payment hash
-            if not verify_preimage(l402_creds.preimage, decoded.id):
-                raise HTTPException(
-                    status_code=401,
-                    detail={"error": "Invalid preimage — does not match payment hash"},
-                )
-
             # Record the payment in stats
             price = self._resolve_price(request)
-            stats.record(endpoint, True, price, client_id, decoded.id)
+            stats.record(endpoint, True, price, client_id, mac_result.payment_hash)
 
             # Return payment info
             return {
                 "paid": True,
-                "payment_hash": decoded.id,
+                "payment_hash": mac_result.payment_hash,
                 "amount_sats": price,
                 "client_id": client_id,
             }
@@ -225,18 +264,12 @@ class TollMiddleware:
 
             # Create macaroon bound to this payment
             expires_at = int(time.time()) + macaroon_expiry
-            mac_opts: Dict[str, Any] = {
-                "payment_hash": invoice_result.payment_hash,
-                "expires_at": expires_at,
-            }
-            if bind_endpoint:
-                mac_opts["endpoint"] = endpoint
-            if bind_method:
-                mac_opts["method"] = request.method
-            if bind_ip:
-                mac_opts["ip"] = client_id
-
-            macaroon = create_macaroon(secret, **mac_opts)
+            macaroon = create_macaroon(
+                secret,
+                payment_hash=invoice_result.payment_hash,
+                expires_at=expires_at,
+                **context,
+            )
 
             # Build 402 response
             www_auth = format_challenge(invoice_result.invoice, macaroon.raw)
@@ -250,28 +283,18 @@ class TollMiddleware:
 
             # Fire on_payment callback when payment is received (async, non-blocking)
             if on_payment:
-                async def _monitor_payment():
-                    try:
-                        result = await wallet.wait_for_payment(
-                            invoice_result.payment_hash,
-                            timeout_ms=invoice_expiry * 1000,
-                        )
-                        if result.paid:
-                            try:
-                                on_payment({
-                                    "payment_hash": invoice_result.payment_hash,
-                                    "amount_sats": amount_sats,
-                                    "endpoint": endpoint,
-                                    "preimage": result.preimage,
-                                    "settled_at": result.settled_at,
-                                    "client_id": client_id,
-                                })
-                            except Exception:
-                                pass  # Don't crash on callback errors
-                    except Exception:
-                        pass  # Timeout or error — ignore
-
-                asyncio.create_task(_monitor_payment())
+                asyncio.create_task(_monitor_payment(
+                    wallet,
+                    invoice_result.payment_hash,
+                    invoice_expiry,
+                    on_payment,
+                    {
+                        "payment_hash": invoice_result.payment_hash,
+                        "amount_sats": amount_sats,
+                        "endpoint": endpoint,
+                        "client_id": client_id,
+                    },
+                ))
 
             # Return 402 with the challenge
             raise HTTPException(
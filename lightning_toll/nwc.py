@@ -6,7 +6,7 @@ Supports: make_invoice, lookup_invoice.
 
 NWC Flow:
 1. Parse the NWC URL to get: relay URL, wallet pubkey, secret key
-2. Connect to the relay via WebSocket
+2. Connect to the relay via WebSocket and subscribe once to our responses
 3. Send NIP-47 encrypted requests (kind 23194)
 4. Receive encrypted responses (kind 23195)
 5. Encryption uses NIP-04 (shared secret from ECDH)
@@ -20,16 +20,22 @@ import json
 import secrets
 import time
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from json.encoder import encode_basestring
+from typing import Any, Dict, Optional, Union
 from urllib.parse import parse_qs, urlparse
 
-import websockets
-import websockets.client
+from ._compat import DATACLASS_SLOTS, json_dumps, json_loads
+from .crypto import (
+    SchnorrSigner,
+    get_public_key,
+    nip04_decrypt_bytes_with_key,
+    nip04_encrypt_with_key,
+    nip04_shared_secret,
+)
+from .relay import connect_relay
 
-from .crypto import get_public_key, nip04_decrypt, nip04_encrypt
 
-
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class NwcConfig:
     """Parsed NWC URL configuration."""
     relay_url: str
@@ -38,21 +44,21 @@ class NwcConfig:
     client_pubkey: str  # derived from secret_key
 
 
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class InvoiceResult:
     """Result from create_invoice."""
     invoice: str
     payment_hash: str
 
 
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class PaymentResult:
     """Result from pay_invoice."""
     preimage: str
     payment_hash: str
 
 
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class LookupResult:
     """Result from lookup_invoice."""
     paid: bool
@@ -100,8 +106,19 @@ def parse_nwc_url(nwc_url: str) -> NwcConfig:
     )
 
 
+def _dumps(obj: Any) -> str:
+    """Serialize a relay frame or NIP-47 payload to compact JSON text."""
+    # Relays expect text frames, so send str rather than bytes
+    return json_dumps(obj).decode("utf-8")
+
+
 def _serialize_event(event: Dict[str, Any]) -> str:
-    """Serialize a Nostr event for signing (NIP-01)."""
+    """
+    Serialize a Nostr event for signing (NIP-01).
+
+    Kept on stdlib json so the escaping matches the NIP-01 rules exactly:
+    the event id is the hash of this string.
+    """
     return json.dumps(
         [
             0,
@@ -116,21 +133,46 @@ def _serialize_event(event: Dict[str, Any]) -> str:
     )
 
 
-def _sign_event(event: Dict[str, Any], secret_key: str) -> Dict[str, Any]:
-    """Sign a Nostr event with the given secret key."""
-    from coincurve import PrivateKey
+def _sign_event_sync(
+    event: Dict[str, Any],
+    secret_key: Union[str, SchnorrSigner],
+    serialized: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Sign a Nostr event with the given secret key.
+
+    Blocking (SHA-256 plus a Schnorr signature); async callers run it in a
+    worker thread.
 
-    serialized = _serialize_event(event)
+    Args:
+        event: Event to sign; id and sig are added in place.
+        secret_key: Hex-encoded secret key, or a SchnorrSigner for it.
+        serialized: The event's NIP-01 serialization, if already built.
+    """
+    if serialized is None:
+        serialized = _serialize_event(event)
     event_hash = hashlib.sha256(serialized.encode("utf-8")).digest()
     event["id"] = event_hash.hex()
 
-    sk = PrivateKey(bytes.fromhex(secret_key))
-    sig = sk.sign_schnorr(event_hash)
+    signer = SchnorrSigner(bytes.fromhex(secret_key)) if isinstance(secret_key, str) else secret_key
+    sig = signer.sign_schnorr(event_hash)
     event["sig"] = sig.hex()
 
     return event
 
 
+def _fail_pending(pending: Dict[str, asyncio.Future], error: Exception) -> None:
+    """Fail all requests still waiting for a response."""
+    for future in pending.values():
+        if not future.done():
+            future.set_exception(error)
+    pending.clear()
+
+
+# Seconds of created_at slack on the response subscription, for wallet clock skew
+RESPONSE_SINCE_SLACK = 60
+
+
 class NwcWallet:
     """
     Minimal NWC wallet client.
@@ -146,24 +188,142 @@ class NwcWallet:
             nwc_url: NWC connection string (nostr+walletconnect://...).
         """
         self.config = parse_nwc_url(nwc_url)
-        self._ws: Optional[websockets.client.WebSocketClientProtocol] = None
+        self._ws: Optional[Any] = None  # relay connection from connect_relay()
         self._connected = False
         self._connect_lock = asyncio.Lock()
+        self._signer = SchnorrSigner(bytes.fromhex(self.config.secret_key))
+        # Both keys are fixed for the wallet's lifetime: derive the NIP-04 key once
+        self._shared_secret = nip04_shared_secret(
+            self.config.secret_key, self.config.wallet_pubkey
+        )
 
-    async def _ensure_connected(self) -> websockets.client.WebSocketClientProtocol:
+        # One long-lived subscription for all responses, demultiplexed by the
+        # request event id in each response's "e" tag
+        self._sub_id: Optional[str] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+
+        # NIP-01 serialization of a request event around created_at and content;
+        # pubkeys are hex and need no escaping
+        self._request_prefix = f'[0,"{self.config.client_pubkey}",'
+        self._request_suffix = f',23194,[["p","{self.config.wallet_pubkey}"]],'
+        # EVENT frame for a signed request: only created_at, content, id and sig vary
+        self._event_frame_prefix = (
+            f'["EVENT",{{"kind":23194,"pubkey":"{self.config.client_pubkey}",'
+            f'"tags":[["p","{self.config.wallet_pubkey}"]],'
+        )
+
+    async def _ensure_connected(self) -> Any:
         """Ensure we have an active WebSocket connection (concurrency-safe)."""
         async with self._connect_lock:
+            # The reader task clears _connected as soon as the connection drops
+            # (keepalive pings are handled by the WebSocket library)
             if self._ws is not None and self._connected:
+                return self._ws
+
+            if self._reader_task is not None:
+                self._reader_task.cancel()
+            if self._ws is not None:
+                old_ws, self._ws = self._ws, None
                 try:
-                    await self._ws.ping()
-                    return self._ws
+                    await old_ws.close()
                 except Exception:
-                    self._connected = False
-                    self._ws = None
-
-            self._ws = await websockets.connect(self.config.relay_url)
+                    pass
+
+            ws = await connect_relay(self.config.relay_url)
+
+            # Subscribe once to every response addressed to us. "since" skips
+            # stored history, with some slack for wallet clock skew.
+            sub_id = secrets.token_hex(16)
+            sub_filter = {
+                "kinds": [23195],
+                "authors": [self.config.wallet_pubkey],
+                "#p": [self.config.client_pubkey],
+                "since": int(time.time()) - RESPONSE_SINCE_SLACK,
+            }
+            try:
+                await ws.send(_dumps(["REQ", sub_id, sub_filter]))
+            except BaseException:
+                await ws.close()
+                raise
+
+            # Each connection gets its own pending map, so a closing reader
+            # only fails the requests that were sent over its connection
+            self._ws = ws
+            self._sub_id = sub_id
+            self._pending = {}
             self._connected = True
-            return self._ws
+            self._reader_task = asyncio.create_task(self._read_responses(ws, sub_id, self._pending))
+            return ws
+
+    async def _read_responses(
+        self,
+        ws: Any,
+        sub_id: str,
+        pending: Dict[str, asyncio.Future],
+    ) -> None:
+        """Route response events from the relay to their pending requests."""
+        sub_id_bytes = sub_id.encode("ascii")
+        try:
+            while True:
+                raw_msg = await ws.recv()
+
+                # Cheap substring check before parsing: frames for other
+                # subscriptions, NOTICEs and EOSEs can't contain our random
+                # sub_id, so they're dropped without a JSON parse
+                needle = sub_id_bytes if isinstance(raw_msg, bytes) else sub_id
+                if needle not in raw_msg:
+                    continue
+
+                # Anyone can publish to the relay, so a malformed frame is
+                # skipped rather than allowed to take down the shared reader
+                try:
+                    msg = json_loads(raw_msg)
+
+                    # Handle EVENT messages (NIP-47 response, kind 23195)
+                    if not (isinstance(msg, list) and len(msg) >= 3 and msg[0] == "EVENT" and msg[1] == sub_id):
+                        continue
+                    response_event = msg[2]
+                    if not isinstance(response_event, dict):
+                        continue
+
+                    request_id = next(
+                        (tag[1] for tag in response_event.get("tags", ()) if len(tag) >= 2 and tag[0] == "e"),
+                        None,
+                    )
+                    future = pending.pop(request_id, None)
+                except (TypeError, KeyError, ValueError):
+                    continue
+                if future is None or future.done():
+                    continue  # Not ours, already answered, or timed out
+
+                try:
+                    decrypted = nip04_decrypt_bytes_with_key(
+                        self._shared_secret, response_event["content"]
+                    )
+                    future.set_result(json_loads(decrypted))
+                except Exception as e:
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass  # Connection closed or broken; reconnect on the next request
+        finally:
+            if self._ws is ws:
+                self._connected = False
+            _fail_pending(pending, ConnectionError("NWC relay connection closed"))
+
+    def _serialize_request(self, created_at: int, content: str) -> str:
+        """Same output as _serialize_event for a kind 23194 request event."""
+        return f"{self._request_prefix}{created_at}{self._request_suffix}{encode_basestring(content)}]"
+
+    def _event_frame(self, event: Dict[str, Any]) -> str:
+        """Relay EVENT frame for a signed request event, without a JSON encoder."""
+        return (
+            f'{self._event_frame_prefix}"created_at":{event["created_at"]},'
+            f'"content":{encode_basestring(event["content"])},'
+            f'"id":"{event["id"]}","sig":"{event["sig"]}"}}]'
+        )
 
     async def _send_nwc_request(
         self,
@@ -182,17 +342,11 @@ class NwcWallet:
         Returns:
             Parsed response result dict.
         """
-        ws = await self._ensure_connected()
-
         # Build the NIP-47 request content
-        request_content = json.dumps({"method": method, "params": params})
+        request_content = _dumps({"method": method, "params": params})
 
         # Encrypt with NIP-04
-        encrypted_content = nip04_encrypt(
-            self.config.secret_key,
-            self.config.wallet_pubkey,
-            request_content,
-        )
+        encrypted_content = nip04_encrypt_with_key(self._shared_secret, request_content)
 
         # Build the Nostr event (kind 23194 = NIP-47 request)
         event = {
@@ -203,71 +357,37 @@ class NwcWallet:
             "content": encrypted_content,
         }
 
-        # Sign the event
-        signed_event = _sign_event(event, self.config.secret_key)
-
-        # Subscribe to responses first
-        sub_id = secrets.token_hex(16)
-        sub_filter = {
-            "kinds": [23195],
-            "authors": [self.config.wallet_pubkey],
-            "#p": [self.config.client_pubkey],
-            "#e": [signed_event["id"]],
-        }
-        await ws.send(json.dumps(["REQ", sub_id, sub_filter]))
+        # Sign the event off the event loop
+        serialized = self._serialize_request(event["created_at"], encrypted_content)
+        signed_event = await asyncio.to_thread(_sign_event_sync, event, self._signer, serialized)
 
-        # Publish the request event
-        await ws.send(json.dumps(["EVENT", signed_event]))
+        # Connect after signing, and take the socket and its pending map together,
+        # so a reconnect can't split the request from the reader that answers it
+        ws = await self._ensure_connected()
+        pending = self._pending
 
-        # Wait for response
+        # Register for the response before publishing, then wait for the reader
+        request_id = signed_event["id"]
+        future = asyncio.get_running_loop().create_future()
+        pending[request_id] = future
         timeout_sec = timeout_ms / 1000
-        deadline = time.time() + timeout_sec
 
         try:
-            while time.time() < deadline:
-                remaining = deadline - time.time()
-                if remaining <= 0:
-                    break
-
-                try:
-                    raw_msg = await asyncio.wait_for(ws.recv(), timeout=remaining)
-                except asyncio.TimeoutError:
-                    break
-
-                msg = json.loads(raw_msg)
-
-                # Handle EVENT messages (NIP-47 response, kind 23195)
-                if isinstance(msg, list) and len(msg) >= 3 and msg[0] == "EVENT" and msg[1] == sub_id:
-                    response_event = msg[2]
-
-                    # Decrypt the response
-                    decrypted = nip04_decrypt(
-                        self.config.secret_key,
-                        self.config.wallet_pubkey,
-                        response_event["content"],
-                    )
-                    result = json.loads(decrypted)
-
-                    # Close subscription
-                    await ws.send(json.dumps(["CLOSE", sub_id]))
-
-                    if result.get("error"):
-                        error = result["error"]
-                        raise RuntimeError(
-                            f"NWC error: {error.get('message', 'Unknown error')} "
-                            f"(code: {error.get('code', 'N/A')})"
-                        )
-
-                    return result.get("result", {})
-
+            await ws.send(self._event_frame(signed_event))
+            result = await asyncio.wait_for(future, timeout=timeout_sec)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"NWC request timed out after {timeout_sec}s") from None
         finally:
-            # Always try to close the subscription
-            try:
-                await ws.send(json.dumps(["CLOSE", sub_id]))
-            except Exception:
-                pass
+            pending.pop(request_id, None)
+
+        if result.get("error"):
+            error = result["error"]
+            raise RuntimeError(
+                f"NWC error: {error.get('message', 'Unknown error')} "
+                f"(code: {error.get('code', 'N/A')})"
+            )
 
-        raise TimeoutError(f"NWC request timed out after {timeout_sec}s")
+        return result.get("result", {})
 
     async def create_invoice(
         self,
@@ -363,27 +483,38 @@ class NwcWallet:
         Returns:
             LookupResult with paid status.
         """
-        deadline = time.time() + (timeout_ms / 1000)
         poll_sec = poll_interval_ms / 1000
 
-        while time.time() < deadline:
-            try:
-                result = await self.lookup_invoice(payment_hash)
-                if result.paid:
-                    return result
-            except Exception:
-                pass  # Ignore transient errors during polling
+        async def poll() -> LookupResult:
+            while True:
+                try:
+                    result = await self.lookup_invoice(payment_hash)
+                    if result.paid:
+                        return result
+                except Exception:
+                    pass  # Ignore transient errors during polling
 
-            await asyncio.sleep(poll_sec)
+                await asyncio.sleep(poll_sec)
 
-        return LookupResult(paid=False)
+        # The event loop tracks the deadline; an in-flight lookup is cancelled
+        try:
+            return await asyncio.wait_for(poll(), timeout=timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            return LookupResult(paid=False)
 
     async def close(self) -> None:
-        """Close the WebSocket connection."""
+        """Close the subscription and the WebSocket connection."""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
         if self._ws is not None:
             try:
+                if self._sub_id is not None:
+                    await self._ws.send(f'["CLOSE","{self._sub_id}"]')
                 await self._ws.close()
             except Exception:
                 pass
             self._ws = None
+            self._sub_id = None
             self._connected = False
+        _fail_pending(self._pending, ConnectionError("NWC wallet closed"))
@@ -0,0 +1,146 @@
+"""
+WebSocket connections to Nostr relays.
+
+NwcWallet only needs send/recv/ping/close on a text-frame connection, so the
+WebSocket library is kept behind connect_relay(). When picows is installed
+(pip install "lightning-toll[speedups]") its Cython frame parser is used;
+otherwise the websockets library. Both backends keep the connection alive
+with protocol-level pings, so callers need no liveness probe of their own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, List, Optional, Union
+
+import websockets
+
+try:
+    from picows import WSListener, WSMsgType, WSTransport, ws_connect
+
+    PICOWS_AVAILABLE = True
+except ImportError:
+    PICOWS_AVAILABLE = False
+
+_CLOSED = object()
+
+# Keepalive: ping after this many idle seconds, drop the connection if no pong
+PING_INTERVAL = 30
+PING_TIMEOUT = 10
+MAX_MESSAGE_SIZE = 2**20
+
+
+async def connect_relay(url: str, backend: Optional[str] = None) -> Any:
+    """
+    Open a WebSocket connection to a relay.
+
+    Args:
+        url: Relay URL (ws:// or wss://).
+        backend: "picows" or "websockets"; defaults to picows when installed.
+
+    Returns:
+        Connection with async send(str), recv(), ping() and close().
+    """
+    if backend is None:
+        backend = "picows" if PICOWS_AVAILABLE else "websockets"
+    if backend == "picows":
+        return await PicowsConnection.connect(url)
+    if backend == "websockets":
+        # NIP-04 payloads are ciphertext, so permessage-deflate only costs CPU
+        return await websockets.connect(
+            url,
+            compression=None,
+            max_size=MAX_MESSAGE_SIZE,
+            max_queue=64,
+            ping_interval=PING_INTERVAL,
+            ping_timeout=PING_TIMEOUT,
+        )
+    raise ValueError(f"Unknown relay backend: {backend!r}")
+
+
+if PICOWS_AVAILABLE:
+
+    class _QueueListener(WSListener):
+        """Reassembles data frames into messages and queues them for recv()."""
+
+        def __init__(self) -> None:
+            self.messages: asyncio.Queue = asyncio.Queue()
+            self.disconnected = False
+            self._parts: List[bytes] = []
+            self._is_text = True
+
+        def on_ws_frame(self, transport: WSTransport, frame: Any) -> None:
+            msg_type = frame.msg_type
+            if msg_type == WSMsgType.CLOSE:
+                transport.send_close(frame.get_close_code())
+                transport.disconnect()
+                return
+            if msg_type == WSMsgType.TEXT or msg_type == WSMsgType.BINARY:
+                self._is_text = msg_type == WSMsgType.TEXT
+                if frame.fin:
+                    self._deliver(frame.get_payload_as_bytes())
+                    return
+                self._parts = [frame.get_payload_as_bytes()]
+            elif msg_type == WSMsgType.CONTINUATION:
+                self._parts.append(frame.get_payload_as_bytes())
+                if frame.fin:
+                    payload, self._parts = b"".join(self._parts), []
+                    self._deliver(payload)
+
+        def _deliver(self, payload: bytes) -> None:
+            self.messages.put_nowait(payload.decode("utf-8") if self._is_text else payload)
+
+        def on_ws_disconnected(self, transport: WSTransport) -> None:
+            self.disconnected = True
+            self.messages.put_nowait(_CLOSED)
+
+
+class PicowsConnection:
+    """picows transport adapted to the send/recv interface NwcWallet uses."""
+
+    def __init__(self, transport: Any, listener: Any):
+        self._transport = transport
+        self._listener = listener
+
+    @classmethod
+    async def connect(cls, url: str) -> "PicowsConnection":
+        """Open a connection to url."""
+        transport, listener = await ws_connect(
+            _QueueListener,
+            url,
+            enable_auto_ping=True,
+            auto_ping_idle_timeout=PING_INTERVAL,
+            auto_ping_reply_timeout=PING_TIMEOUT,
+            max_frame_size=MAX_MESSAGE_SIZE,
+        )
+        return cls(transport, listener)
+
+    async def send(self, message: Union[str, bytes]) -> None:
+        """Send a text frame (or a binary frame for bytes)."""
+        if self._listener.disconnected:
+            raise ConnectionError("relay connection closed")
+        if isinstance(message, str):
+            self._transport.send(WSMsgType.TEXT, message.encode("utf-8"))
+        else:
+            self._transport.send(WSMsgType.BINARY, message)
+
+    async def recv(self) -> Union[str, bytes]:
+        """Wait for the next message; raises ConnectionError once closed."""
+        message = await self._listener.messages.get()
+        if message is _CLOSED:
+            self._listener.messages.put_nowait(_CLOSED)  # keep later recv() calls failing
+            raise ConnectionError("relay connection closed")
+        return message
+
+    async def ping(self) -> None:
+        """Check the connection is open and send a ping."""
+        if self._listener.disconnected:
+            raise ConnectionError("relay connection closed")
+        self._transport.send_ping()
+
+    async def close(self) -> None:
+        """Close the connection."""
+        if not self._listener.disconnected:
+            self._transport.send_close()
+            self._transport.disconnect()
+        await self._transport.wait_disconnected()
@@ -3,16 +3,27 @@ In-memory payment stats tracker.
 
 Tracks revenue, request counts, unique payers, and recent payments.
 Direct port of the Node.js lightning-toll TollStats class.
+
+Unique payers are counted exactly with a set of payer IDs. Past
+max_exact_payers distinct payers the set is folded into a HyperLogLog sketch,
+so memory stays constant (16 KB) however many IPs or pubkeys pay; from then
+on the count is an estimate with an error under 1%.
 """
 
 from __future__ import annotations
 
+import hashlib
+import math
 import time
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Set
+from itertools import islice
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from ._compat import DATACLASS_SLOTS, json_dumps
 
 
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class PaymentRecord:
     """A single payment record."""
     endpoint: str
@@ -22,10 +33,73 @@ class PaymentRecord:
     timestamp: float  # milliseconds since epoch (matches Node.js)
 
 
+@dataclass(**DATACLASS_SLOTS)
+class EndpointStats:
+    """Running counters for one endpoint."""
+    revenue: int = 0
+    requests: int = 0
+    paid: int = 0
+    free: int = 0
+
+
+class HyperLogLog:
+    """Approximate distinct counter with a fixed number of registers."""
+
+    def __init__(self, precision: int = 14):
+        """
+        Initialize the sketch.
+
+        Args:
+            precision: Number of index bits; uses 2**precision one-byte registers.
+        """
+        self.precision = precision
+        self._m = 1 << precision
+        self._registers = bytearray(self._m)
+        self._alpha = 0.7213 / (1 + 1.079 / self._m)
+        # Registers per rank value, kept up to date by add() so estimate()
+        # never has to scan the registers
+        self._histogram = [0] * (64 - precision + 2)
+        self._histogram[0] = self._m
+
+    def add(self, item: str) -> None:
+        """Add an item to the sketch."""
+        h = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        old = self._registers[index]
+        if rank > old:
+            self._registers[index] = rank
+            self._histogram[old] -= 1
+            self._histogram[rank] += 1
+
+    def estimate(self) -> int:
+        """Estimated number of distinct items added."""
+        m = self._m
+        zeros = self._histogram[0]
+        if zeros == m:
+            return 0
+        raw = self._alpha * m * m / sum(
+            count * 2.0 ** -rank for rank, count in enumerate(self._histogram) if count
+        )
+        # Linear counting is far more accurate while many registers are empty
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
 class TollStats:
     """In-memory payment statistics tracker."""
 
-    def __init__(self, max_recent: int = 100):
+    def __init__(self, max_recent: int = 100, max_exact_payers: Optional[int] = 10_000):
+        """
+        Initialize the tracker.
+
+        Args:
+            max_recent: Number of recent payments to keep.
+            max_exact_payers: Distinct payers counted exactly before switching
+                to a constant-size HyperLogLog estimate; None never switches.
+        """
         self.max_recent = max_recent
 
         # Totals
@@ -33,14 +107,21 @@ class TollStats:
         self.total_requests: int = 0
         self.total_paid: int = 0
 
-        # Per-endpoint: path → { revenue, requests, paid, free }
-        self._endpoints: Dict[str, Dict[str, int]] = {}
+        # Per-endpoint: path → EndpointStats
+        self._endpoints: Dict[str, EndpointStats] = {}
 
         # Unique payers (by IP or pubkey)
-        self._payers: Set[str] = set()
+        self.max_exact_payers = max_exact_payers
+        self._payers: Optional[Set[str]] = set()
+        self._payers_hll: Optional[HyperLogLog] = None
 
-        # Recent payments (ring buffer)
-        self._recent_payments: List[PaymentRecord] = []
+        # Recent payments (ring buffer; the deque drops the oldest on overflow)
+        self._recent_payments: Deque[PaymentRecord] = deque(maxlen=max_recent)
+
+        # Bumped by record(); the summary is only rebuilt when it has moved on
+        self._gen: int = 0
+        self._cache: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._json_cache: Optional[Tuple[int, bytes]] = None
 
     def record(
         self,
@@ -63,19 +144,24 @@ class TollStats:
         self.total_requests += 1
 
         # Per-endpoint stats
-        if endpoint not in self._endpoints:
-            self._endpoints[endpoint] = {"revenue": 0, "requests": 0, "paid": 0, "free": 0}
-        ep = self._endpoints[endpoint]
-        ep["requests"] += 1
+        ep = self._endpoints.get(endpoint)
+        if ep is None:
+            ep = self._endpoints[endpoint] = EndpointStats()
+        ep.requests += 1
 
         if paid and amount_sats > 0:
             self.total_revenue += amount_sats
             self.total_paid += 1
-            ep["revenue"] += amount_sats
-            ep["paid"] += 1
+            ep.revenue += amount_sats
+            ep.paid += 1
 
             if payer_id:
-                self._payers.add(payer_id)
+                if self._payers is not None:
+                    self._payers.add(payer_id)
+                    if self.max_exact_payers is not None and len(self._payers) > self.max_exact_payers:
+                        self._fold_payers()
+                else:
+                    self._payers_hll.add(payer_id)
 
             # Add to recent payments
             self._recent_payments.append(
@@ -87,23 +173,36 @@ class TollStats:
                     timestamp=time.time() * 1000,  # ms since epoch
                 )
             )
-
-            # Trim recent payments
-            if len(self._recent_payments) > self.max_recent:
-                self._recent_payments = self._recent_payments[-self.max_recent:]
         else:
-            ep["free"] += 1
+            ep.free += 1
+
+        self._gen += 1
+
+    def _fold_payers(self) -> None:
+        """Move the exact payer set into a HyperLogLog sketch and drop it."""
+        hll = HyperLogLog()
+        for payer in self._payers:
+            hll.add(payer)
+        self._payers_hll = hll
+        self._payers = None
 
     def to_dict(self) -> Dict[str, Any]:
         """
         Get stats summary as a plain dict.
 
+        The summary is cached until the next record(), so repeated dashboard
+        polls are cheap; treat the returned dict as read-only.
+
         Returns:
             Dict with stats matching the Node.js format.
         """
-        endpoint_stats = {}
-        for path, data in self._endpoints.items():
-            endpoint_stats[path] = dict(data)
+        if self._cache is not None and self._cache[0] == self._gen:
+            return self._cache[1]
+
+        endpoint_stats = {
+            path: {"revenue": ep.revenue, "requests": ep.requests, "paid": ep.paid, "free": ep.free}
+            for path, ep in self._endpoints.items()
+        }
 
         recent = [
             {
@@ -113,18 +212,30 @@ class TollStats:
                 "paymentHash": r.payment_hash,
                 "timestamp": r.timestamp,
             }
-            for r in self._recent_payments[-20:]
+            for r in islice(reversed(self._recent_payments), 20)
         ]
-        recent.reverse()
 
-        return {
+        if self._payers is not None:
+            unique_payers = len(self._payers)
+        else:
+            unique_payers = self._payers_hll.estimate()
+
+        summary = {
             "totalRevenue": self.total_revenue,
             "totalRequests": self.total_requests,
             "totalPaid": self.total_paid,
-            "uniquePayers": len(self._payers),
+            "uniquePayers": unique_payers,
             "endpoints": endpoint_stats,
             "recentPayments": recent,
         }
+        self._cache = (self._gen, summary)
+        return summary
+
+    def to_json_bytes(self) -> bytes:
+        """Get the stats summary serialized to JSON, cached like to_dict()."""
+        if self._json_cache is None or self._json_cache[0] != self._gen:
+            self._json_cache = (self._gen, json_dumps(self.to_dict()))
+        return self._json_cache[1]
 
     # Alias for compatibility
     def to_json(self) -> Dict[str, Any]:
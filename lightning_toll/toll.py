@@ -10,6 +10,7 @@ This is the Python equivalent of createToll() in the Node.js lightning-toll.
 from __future__ import annotations
 
 import functools
+import inspect
 from typing import Any, Callable, Dict, Optional, Union
 
 from .middleware import TollMiddleware
@@ -72,14 +73,27 @@ class Toll:
         """
 
         def decorator(func: Callable) -> Callable:
+            from fastapi import Request
+
             middleware = TollMiddleware(self._config, route_opts)
 
+            # Inspect the handler once here rather than on every request
+            params = inspect.signature(func).parameters
+            accepts_payment = "payment" in params
+            request_index: Optional[int] = None
+            for index, param in enumerate(params.values()):
+                if param.kind not in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+                    break
+                if param.name == "request" or param.annotation in (Request, "Request"):
+                    request_index = index
+                    break
+
             @functools.wraps(func)
             async def wrapper(*args: Any, **kwargs: Any) -> Any:
                 # Extract request from kwargs (FastAPI injects it)
-                from fastapi import Request
-
                 request = kwargs.get("request")
+                if request is None and request_index is not None and request_index < len(args):
+                    request = args[request_index]
                 if request is None:
                     # Try to find it in args (shouldn't happen with FastAPI)
                     for arg in args:
@@ -97,10 +111,7 @@ class Toll:
                 payment = await middleware(request)
 
                 # Inject payment info if handler accepts it
-                import inspect
-
-                sig = inspect.signature(func)
-                if "payment" in sig.parameters:
+                if accepts_payment:
                     kwargs["payment"] = payment
 
                 return await func(*args, **kwargs)
@@ -120,10 +131,15 @@ class Toll:
 
         Or mount directly:
             app.add_api_route("/api/stats", toll.dashboard())
+
+        The handler returns the pre-serialized JSON from the stats tracker,
+        so FastAPI doesn't re-encode an unchanged summary on every poll.
         """
 
-        async def dashboard_handler() -> Dict[str, Any]:
-            return self.stats.to_dict()
+        async def dashboard_handler() -> Any:
+            from fastapi import Response
+
+            return Response(content=self.stats.to_json_bytes(), media_type="application/json")
 
         return dashboard_handler
 
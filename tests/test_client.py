@@ -0,0 +1,380 @@
+"""Tests for the L402 client SDK."""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+
+import httpx
+import pytest
+
+from lightning_toll.client import CachedCredential, CredentialCache, TollClient
+from lightning_toll.client import fetch as fetch_module
+from lightning_toll.client.cache import cache_key
+
+
+PREIMAGE = "deadbeefdeadbeefdeadbeefdeadbeefdeadbeefdeadbeefdeadbeefdeadbeef"
+MACAROON = "eyJpZCI6InRlc3QifQ"
+
+
+@dataclass
+class FakePaymentResult:
+    preimage: str = PREIMAGE
+    payment_hash: str = "hash"
+
+
+class FakeWallet:
+    """Wallet stub that records paid invoices."""
+
+    def __init__(self):
+        self.paid = []
+        self.closed = False
+
+    async def pay_invoice(self, invoice):
+        await asyncio.sleep(0.01)  # let concurrent fetches interleave
+        self.paid.append(invoice)
+        return FakePaymentResult()
+
+    async def close(self):
+        self.closed = True
+
+
+def toll_server(price: int = 5):
+    """Build an httpx handler that behaves like a toll-gated endpoint."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.headers.get("authorization") == f"L402 {MACAROON}:{PREIMAGE}":
+            return httpx.Response(200, json={"path": request.url.path})
+        return httpx.Response(
+            402,
+            json={
+                "invoice": "lnbc50n1test",
+                "macaroon": MACAROON,
+                "paymentHash": "hash",
+                "amountSats": price,
+            },
+        )
+
+    return handler
+
+
+async def make_client(handler, **kwargs) -> TollClient:
+    """Create a TollClient whose HTTP requests go to the given handler."""
+    client = TollClient(wallet=FakeWallet(), **kwargs)
+    await client._http.aclose()
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def make_credential(ttl: float) -> CachedCredential:
+    return CachedCredential(
+        macaroon=MACAROON,
+        preimage=PREIMAGE,
+        expiry=time.monotonic() + ttl,
+        wall_expiry=time.time() + ttl,
+    )
+
+
+class TestCacheKey:
+    def test_drops_query_string(self):
+        assert cache_key("GET", "https://api.example.com/data?page=1") == cache_key(
+            "GET", "https://api.example.com/data?page=2"
+        )
+
+    def test_includes_method(self):
+        assert cache_key("GET", "https://api.example.com/data") != cache_key(
+            "POST", "https://api.example.com/data"
+        )
+
+    def test_normalizes_method_case(self):
+        assert cache_key("get", "https://a.example/x") == "GET:https://a.example/x"
+
+
+class TestCredentialCache:
+    def test_expired_entries_are_dropped(self):
+        cache = CredentialCache()
+        cache.set("k", make_credential(-1))
+        assert cache.get("k") is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        cache = CredentialCache(maxsize=2)
+        cache.set("a", make_credential(60))
+        cache.set("b", make_credential(60))
+        cache.get("a")  # "b" is now the oldest
+        cache.set("c", make_credential(60))
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+
+    def test_writes_sweep_expired_entries(self):
+        cache = CredentialCache()
+        cache.set("stale", make_credential(0.01))
+        cache.set("replaced", make_credential(0.01))
+        cache.set("replaced", make_credential(60))
+        time.sleep(0.02)
+        cache.set("fresh", make_credential(60))
+        assert "stale" not in cache
+        assert "replaced" in cache
+        assert len(cache) == 2
+
+    def test_persists_to_disk(self, tmp_path):
+        pytest.importorskip("diskcache")
+        cache = CredentialCache(cache_dir=str(tmp_path))
+        cache.set("k", make_credential(60))
+        cache.close()
+
+        reopened = CredentialCache(cache_dir=str(tmp_path))
+        cred = reopened.get("k")
+        assert cred is not None
+        assert cred.macaroon == MACAROON
+        assert 0 < cred.expiry - time.monotonic() <= 60
+        reopened.close()
+
+
+class TestTollResponse:
+    def test_accepts_body_in_constructor(self):
+        response = fetch_module.TollResponse(status_code=200, headers={}, body={"ok": True})
+        assert response.body == {"ok": True}
+        assert response.json() == {"ok": True}
+        assert fetch_module.TollResponse(200, {}, "positional").body == "positional"
+
+    def test_body_is_assignable(self):
+        response = fetch_module.TollResponse(status_code=200, headers={}, content=b'{"a": 1}')
+        assert response.body == {"a": 1}
+        response.body = "replaced"
+        assert response.body == "replaced"
+
+
+class TestTollClient:
+    @pytest.mark.asyncio
+    async def test_pays_and_retries_on_402(self):
+        client = await make_client(toll_server(price=5))
+        response = await client.fetch("https://api.example.com/data")
+
+        assert response.status_code == 200
+        assert response.paid is True
+        assert response.amount_sats == 5
+        assert client.wallet.paid == ["lnbc50n1test"]
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_returns_challenge_without_auto_retry(self):
+        client = await make_client(toll_server(price=5), auto_retry=False)
+        response = await client.fetch("https://api.example.com/data")
+
+        assert response.status_code == 402
+        assert response.body["invoice"] == "lnbc50n1test"
+        assert client.wallet.paid == []
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_reuses_credential_across_query_strings(self):
+        client = await make_client(toll_server())
+        await client.fetch("https://api.example.com/data?page=1")
+        response = await client.fetch("https://api.example.com/data?page=2")
+
+        assert response.status_code == 200
+        assert response.paid is False
+        assert len(client.wallet.paid) == 1
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_pays_new_challenge_when_cached_credential_rejected(self):
+        requests = []
+        server = toll_server()
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return server(request)
+
+        client = await make_client(handler)
+        client._credential_cache.set(
+            cache_key("GET", "https://api.example.com/data"),
+            CachedCredential(macaroon="revoked", preimage="00", expiry=time.monotonic() + 60),
+        )
+        response = await client.fetch("https://api.example.com/data")
+
+        assert response.status_code == 200
+        assert response.paid is True
+        # Rejected cached credential + paid retry, no extra unauthenticated request
+        assert len(requests) == 2
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_shares_cache_between_clients(self):
+        cache = CredentialCache()
+        first = await make_client(toll_server(), credential_cache=cache)
+        second = await make_client(toll_server(), credential_cache=cache)
+
+        await first.fetch("https://api.example.com/data")
+        response = await second.fetch("https://api.example.com/data")
+
+        assert response.paid is False
+        assert second.wallet.paid == []
+        await first.close()
+        await second.close()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_fetches_pay_once(self):
+        client = await make_client(toll_server())
+        responses = await asyncio.gather(
+            *(client.fetch("https://api.example.com/data") for _ in range(5))
+        )
+
+        assert all(r.status_code == 200 for r in responses)
+        assert len(client.wallet.paid) == 1
+        assert client.payment_count == 1
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_waiter_takes_over_when_payer_fails(self):
+        client = await make_client(toll_server())
+        real_pay = client.wallet.pay_invoice
+        attempts = []
+
+        async def pay_invoice(invoice):
+            attempts.append(invoice)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.01)
+                raise RuntimeError("route not found")
+            return await real_pay(invoice)
+
+        client.wallet.pay_invoice = pay_invoice
+        responses = await asyncio.gather(
+            *(client.fetch("https://api.example.com/data") for _ in range(5)),
+            return_exceptions=True,
+        )
+
+        assert isinstance(responses[0], RuntimeError)
+        assert [r.status_code for r in responses[1:]] == [200] * 4
+        assert len(attempts) == 2  # the failed payment and one successful retry
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_free_endpoint_requests_run_concurrently(self):
+        in_flight = []
+        peak = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            in_flight.append(request)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(request)
+            return httpx.Response(200, json={"free": True})
+
+        client = await make_client(handler)
+        await asyncio.gather(*(client.fetch("https://api.example.com/free") for _ in range(5)))
+
+        assert max(peak) == 5
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_refreshes_credential_in_background(self):
+        # Default credential lifetime is 300s, so it is inside the refresh window at once
+        client = await make_client(toll_server(), refresh_before=300)
+        await client.fetch("https://api.example.com/data")
+
+        response = await client.fetch("https://api.example.com/data")
+        assert response.paid is False  # served from the stale credential
+        assert len(client.wallet.paid) == 1
+
+        await asyncio.gather(*client._refresh_tasks)
+        assert len(client.wallet.paid) == 2
+        assert client.payment_count == 2
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_close_waits_for_refresh_to_cache_credential(self):
+        client = await make_client(toll_server(), refresh_before=300)
+        await client.fetch("https://api.example.com/data")
+        await client.fetch("https://api.example.com/data")  # starts a refresh
+        old = client._credential_cache.get(cache_key("GET", "https://api.example.com/data"))
+
+        await client.close(close_wallet=False)
+        assert len(client.wallet.paid) == 2
+        assert client._refresh_tasks == set()
+        assert client._credential_cache.get(cache_key("GET", "https://api.example.com/data")) is not old
+
+    @pytest.mark.asyncio
+    async def test_refresh_failure_is_logged(self, caplog):
+        client = await make_client(toll_server(), refresh_before=300)
+        await client.fetch("https://api.example.com/data")
+        client.max_sats = 1  # the replacement is over budget
+
+        await client.fetch("https://api.example.com/data")
+        await asyncio.gather(*client._refresh_tasks)
+        assert "exceeds budget" in caplog.text
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_sends_json_body(self):
+        seen = {}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen["content_type"] = request.headers.get("content-type")
+            seen["body"] = json.loads(request.content)
+            return httpx.Response(200, text="ok")
+
+        client = await make_client(handler)
+        response = await client.fetch(
+            "https://api.example.com/data", method="POST", body={"q": "sats"}
+        )
+
+        assert seen == {"content_type": "application/json", "body": {"q": "sats"}}
+        assert response.body == "ok"
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_parse_bytes_skips_decoding(self):
+        client = await make_client(lambda request: httpx.Response(200, content=b"\x00\xff"))
+        response = await client.fetch("https://api.example.com/blob", parse="bytes")
+
+        assert response.body == b"\x00\xff"
+        assert response.content == b"\x00\xff"
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_parse_json_decodes_eagerly(self):
+        client = await make_client(lambda request: httpx.Response(200, text="not json"))
+        with pytest.raises(ValueError):
+            await client.fetch("https://api.example.com/data", parse="json")
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_rejects_price_over_budget(self):
+        client = await make_client(toll_server(price=500), max_sats=100)
+        with pytest.raises(RuntimeError, match="exceeds budget"):
+            await client.fetch("https://api.example.com/data")
+        assert client.wallet.paid == []
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_close_can_leave_wallet_open(self):
+        client = await make_client(toll_server())
+        await client.close(close_wallet=False)
+        assert client.wallet.closed is False
+        await client.close()
+        assert client.wallet.closed is True
+
+
+class TestTollFetchMany:
+    @pytest.mark.asyncio
+    async def test_fetches_in_order_and_pays_once_per_endpoint(self, monkeypatch):
+        transport = httpx.MockTransport(toll_server())
+        real_client = httpx.AsyncClient
+        monkeypatch.setattr(
+            fetch_module.httpx,
+            "AsyncClient",
+            lambda **kwargs: real_client(transport=transport),
+        )
+        wallet = FakeWallet()
+        urls = [f"https://api.example.com/data?page={i}" for i in range(4)]
+        urls.append("https://api.example.com/other")
+
+        responses = await fetch_module.toll_fetch_many(urls, wallet=wallet, concurrency=2)
+
+        assert [r.status_code for r in responses] == [200] * 5
+        assert responses[-1].body == {"path": "/other"}
+        assert len(wallet.paid) == 2
+        assert wallet.closed is False  # the caller's wallet stays open
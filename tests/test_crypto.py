@@ -0,0 +1,96 @@
+"""Tests for NIP-04 encryption helpers."""
+
+import hashlib
+
+import pytest
+from coincurve import PublicKeyXOnly
+
+from lightning_toll import crypto
+from lightning_toll.crypto import (
+    SchnorrSigner,
+    clear_shared_secret_cache,
+    compute_shared_secret,
+    cpu_crypto_features,
+    get_public_key,
+    nip04_decrypt,
+    nip04_decrypt_bytes,
+    nip04_decrypt_with_key,
+    nip04_encrypt,
+    nip04_encrypt_with_key,
+    nip04_shared_secret,
+)
+
+
+ALICE = "11" * 32
+BOB = "22" * 32
+
+
+class TestPublicKey:
+    def test_is_x_only_hex(self):
+        pub = get_public_key(ALICE)
+        assert len(pub) == 64
+        assert get_public_key(ALICE) is pub  # cached
+
+
+class TestSharedSecret:
+    def test_is_symmetric(self):
+        assert compute_shared_secret(ALICE, get_public_key(BOB)) == compute_shared_secret(
+            BOB, get_public_key(ALICE)
+        )
+
+    def test_is_cached_per_key_pair(self):
+        clear_shared_secret_cache()
+        bob_pub = get_public_key(BOB)
+        nip04_encrypt(ALICE, bob_pub, "a")
+        nip04_encrypt(ALICE, bytes.fromhex(bob_pub), "b")
+        info = crypto._shared_secret_cached.cache_info()
+        assert (info.misses, info.hits) == (1, 1)
+
+        clear_shared_secret_cache()
+        assert crypto._shared_secret_cached.cache_info().currsize == 0
+
+
+class TestSchnorrSigner:
+    def test_signatures_verify(self):
+        message = hashlib.sha256(b"event").digest()
+        signer = SchnorrSigner(bytes.fromhex(ALICE))
+        signatures = {signer.sign_schnorr(message) for _ in range(2)}
+        pubkey = PublicKeyXOnly(bytes.fromhex(get_public_key(ALICE)))
+        assert len(signatures) == 2  # fresh aux randomness per signature
+        assert all(pubkey.verify(sig, message) for sig in signatures)
+
+    def test_failed_self_test_falls_back_to_public_api(self, monkeypatch):
+        monkeypatch.setattr(SchnorrSigner, "_sign_raw", lambda self, message: bytes(64))
+        signer = SchnorrSigner(bytes.fromhex(ALICE))
+        assert signer._keypair is None
+
+        message = hashlib.sha256(b"event").digest()
+        pubkey = PublicKeyXOnly(bytes.fromhex(get_public_key(ALICE)))
+        assert pubkey.verify(signer.sign_schnorr(message), message)
+
+
+class TestNip04:
+    def test_round_trip(self):
+        encrypted = nip04_encrypt(ALICE, get_public_key(BOB), "⚡ hello")
+        assert "?iv=" in encrypted
+        assert nip04_decrypt(BOB, get_public_key(ALICE), encrypted) == "⚡ hello"
+        assert nip04_decrypt_bytes(BOB, get_public_key(ALICE), encrypted) == "⚡ hello".encode()
+
+    def test_with_key_matches_keyed_functions(self):
+        key = nip04_shared_secret(ALICE, get_public_key(BOB))
+        assert key == nip04_shared_secret(BOB, get_public_key(ALICE))
+
+        encrypted = nip04_encrypt_with_key(key, "sats")
+        assert nip04_decrypt(BOB, get_public_key(ALICE), encrypted) == "sats"
+        assert nip04_decrypt_with_key(key, nip04_encrypt(BOB, get_public_key(ALICE), "back")) == "back"
+
+    def test_rejects_malformed_ciphertext(self):
+        with pytest.raises(ValueError, match="Invalid NIP-04"):
+            nip04_decrypt(BOB, get_public_key(ALICE), "no-iv-here")
+
+
+class TestCpuFeatures:
+    def test_reports_aes_and_sha(self):
+        features = cpu_crypto_features()
+        assert set(features) == {"aes", "sha"}
+        assert all(value in (True, False, None) for value in features.values())
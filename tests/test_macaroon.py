@@ -1,19 +1,31 @@
 """Tests for the macaroon module."""
 
+import hashlib
+import hmac
 import time
+from collections import OrderedDict
 
 import pytest
 
+from lightning_toll import macaroon as macaroon_module
 from lightning_toll.macaroon import (
+    _hmac_sha256,
+    clear_verified_cache,
     create_macaroon,
     decode_macaroon,
     verify_macaroon,
+    verify_macaroon_raw,
+    verify_macaroons,
     verify_preimage,
 )
 
 
 SECRET = "test-secret-key-for-hmac-signing"
+SECRET_BYTES = SECRET.encode()
 PAYMENT_HASH = "a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2"
+PREIMAGE = "deadbeef" * 8  # 32 bytes hex
+PREIMAGE_BYTES = bytes.fromhex(PREIMAGE)
+PREIMAGE_HASH_BYTES = hashlib.sha256(PREIMAGE_BYTES).digest()
 
 
 class TestCreateMacaroon:
@@ -63,6 +75,32 @@ class TestCreateMacaroon:
             "ip = 1.2.3.4",
         ]
 
+    @pytest.mark.parametrize("secret", [SECRET, "s" * 64, "long-" * 40])
+    def test_signature_chain_matches_stdlib_hmac(self, secret):
+        mac = create_macaroon(secret, payment_hash=PAYMENT_HASH, endpoint="/api/x", method="GET")
+        sig = hmac.new(secret.encode(), PAYMENT_HASH.encode(), hashlib.sha256).digest()
+        for caveat in mac.caveats:
+            sig = hmac.new(sig, caveat.encode(), hashlib.sha256).digest()
+        assert mac.signature == sig.hex()
+
+    def test_repeat_mint_returns_independent_macaroons(self):
+        first = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, endpoint="/api/x")
+        second = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, endpoint="/api/x")
+        assert first == second
+        first.caveats.append("ip = 1.2.3.4")
+        assert second.caveats == ["endpoint = /api/x"]
+        assert create_macaroon("other", payment_hash=PAYMENT_HASH).signature != first.signature
+
+    def test_accepts_bytes_secret(self):
+        from_bytes = create_macaroon(SECRET_BYTES, payment_hash=PAYMENT_HASH, method="GET")
+        from_str = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, method="GET")
+        assert from_bytes.signature == from_str.signature
+        assert verify_macaroon(SECRET_BYTES, decode_macaroon(from_str.raw)).valid is True
+
+    def test_hmac_sha256_matches_stdlib(self):
+        for key in (b"", b"k" * 32, b"k" * 64):
+            assert _hmac_sha256(key, b"msg") == hmac.digest(key, b"msg", "sha256")
+
 
 class TestEncodeDecode:
     def test_roundtrip(self):
@@ -80,6 +118,20 @@ class TestEncodeDecode:
         assert decoded.caveats == mac.caveats
         assert decoded.signature == mac.signature
 
+    def test_repeat_decodes_do_not_share_caveats(self):
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, endpoint="/api/data")
+        first = decode_macaroon(mac.raw)
+        first.caveats.append("endpoint = /api/other")
+        assert decode_macaroon(mac.raw).caveats == ["endpoint = /api/data"]
+
+    def test_byte_caches_are_not_constructor_fields(self):
+        with pytest.raises(TypeError):
+            macaroon_module.Macaroon(
+                id=PAYMENT_HASH, caveats=[], signature="00" * 32, _signature_bytes=("00" * 32, b"")
+            )
+        mac = macaroon_module.Macaroon(id=PAYMENT_HASH, caveats=[], signature="ab" * 32)
+        assert mac.signature_bytes == bytes.fromhex("ab" * 32)
+
     def test_decode_invalid_base64(self):
         assert decode_macaroon("not-valid-base64!!!") is None
 
@@ -96,6 +148,16 @@ class TestEncodeDecode:
         bad = base64.urlsafe_b64encode(json.dumps({"id": "x"}).encode()).decode().rstrip("=")
         assert decode_macaroon(bad) is None
 
+    def test_decode_accepts_other_key_order_and_spacing(self):
+        import base64
+        import json
+
+        payload = {"signature": "ab" * 32, "caveats": [], "id": PAYMENT_HASH}
+        raw = base64.urlsafe_b64encode(json.dumps(payload, indent=2).encode()).decode().rstrip("=")
+        decoded = decode_macaroon(raw)
+        assert decoded is not None
+        assert decoded.id == PAYMENT_HASH
+
 
 class TestVerifyMacaroon:
     def test_valid_macaroon(self):
@@ -164,6 +226,12 @@ class TestVerifyMacaroon:
         result = verify_macaroon(SECRET, decoded, {"method": "get"})
         assert result.valid is True
 
+    def test_lowercase_method_caveat_matches(self):
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, method="post")
+        decoded = decode_macaroon(mac.raw)
+        assert verify_macaroon(SECRET, decoded, {"method": "POST"}).valid is True
+        assert verify_macaroon(SECRET, decoded, {"method": "GET"}).valid is False
+
     def test_no_context_skips_caveats(self):
         """If context doesn't include endpoint/method, those caveats are skipped."""
         mac = create_macaroon(
@@ -190,14 +258,110 @@ class TestVerifyMacaroon:
         assert result.valid is False
         assert "signature" in result.error.lower()
 
+    def test_replaced_signature_is_reparsed(self):
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH)
+        decoded = decode_macaroon(mac.raw)
+        assert verify_macaroon(SECRET, decoded).valid is True
+        decoded.signature = "00" * 32
+        assert verify_macaroon(SECRET, decoded).valid is False
+        decoded.signature = "not hex"
+        assert "signature" in verify_macaroon(SECRET, decoded).error.lower()
+
+    def test_repeat_verification_skips_hmac_chain(self, monkeypatch):
+        clear_verified_cache()
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, endpoint="/api/a")
+        assert verify_macaroon(SECRET, decode_macaroon(mac.raw)).valid is True
+
+        def fail(*args):
+            raise AssertionError("HMAC chain recomputed")
+
+        monkeypatch.setattr(macaroon_module, "_root_signature", fail)
+        assert verify_macaroon(SECRET, decode_macaroon(mac.raw)).valid is True
+        # Caveats are still checked against each request's context
+        result = verify_macaroon(SECRET, decode_macaroon(mac.raw), {"endpoint": "/api/b"})
+        assert "Endpoint mismatch" in result.error
+
+    def test_verified_cache_is_keyed_on_secret_and_caveats(self):
+        clear_verified_cache()
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, method="GET")
+        assert verify_macaroon(SECRET, decode_macaroon(mac.raw)).valid is True
+        assert verify_macaroon("other-secret", decode_macaroon(mac.raw)).valid is False
+
+        decoded = decode_macaroon(mac.raw)
+        decoded.caveats.append("endpoint = /anything")
+        assert verify_macaroon(SECRET, decoded).valid is False
+
+    def test_entry_evicted_by_another_thread_is_a_miss(self, monkeypatch):
+        class EvictingCache(OrderedDict):
+            def move_to_end(self, key, last=True):
+                self.pop(key)  # another thread evicts between get() and here
+                super().move_to_end(key, last)
+
+        monkeypatch.setattr(macaroon_module, "_verified_signatures", EvictingCache())
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH)
+        assert verify_macaroon(SECRET, decode_macaroon(mac.raw)).valid is True
+        assert verify_macaroon(SECRET, decode_macaroon(mac.raw)).valid is True
+
+    def test_cached_signature_still_compared(self, monkeypatch):
+        clear_verified_cache()
+        mac = create_macaroon(SECRET, payment_hash=PAYMENT_HASH)
+        assert verify_macaroon(SECRET, decode_macaroon(mac.raw)).valid is True
+
+        monkeypatch.setattr(macaroon_module, "_root_signature", None)  # must not be called
+        decoded = decode_macaroon(mac.raw)
+        decoded.signature = "00" * 32
+        assert "signature" in verify_macaroon(SECRET, decoded).error.lower()
+
+    def test_batch_matches_individual_results(self):
+        expires_at = int(time.time()) + 3600
+        good = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, expires_at=expires_at, method="GET")
+        wrong_method = create_macaroon(SECRET, payment_hash=PAYMENT_HASH, method="POST")
+        forged = create_macaroon("other-secret", payment_hash=PAYMENT_HASH)
+        macaroons = [decode_macaroon(m.raw) for m in (good, wrong_method, forged)]
+
+        results = verify_macaroons(SECRET, macaroons, {"method": "GET"})
+        assert results == [verify_macaroon(SECRET, m, {"method": "GET"}) for m in macaroons]
+        assert [r.valid for r in results] == [True, False, False]
+
+    def test_batch_checks_each_caveat_once(self, monkeypatch):
+        macaroons = [
+            decode_macaroon(create_macaroon(SECRET, payment_hash=f"{i:064x}", endpoint="/api/x").raw)
+            for i in range(5)
+        ]
+        checked = []
+        real_caveat_error = macaroon_module._caveat_error
+
+        def caveat_error(caveat, context):
+            checked.append(caveat)
+            return real_caveat_error(caveat, context)
+
+        monkeypatch.setattr(macaroon_module, "_caveat_error", caveat_error)
+        results = verify_macaroons(SECRET, macaroons, {"endpoint": "/api/x"})
+        assert all(r.valid for r in results)
+        assert checked == ["endpoint = /api/x"]
+
+
+class TestVerifyMacaroonRaw:
+    def test_valid_token_and_preimage(self):
+        payment_hash = PREIMAGE_HASH_BYTES.hex()
+        mac = create_macaroon(SECRET, payment_hash=payment_hash, endpoint="/api/x")
+        result = verify_macaroon_raw(SECRET, mac.raw, PREIMAGE, {"endpoint": "/api/x"})
+        assert result.valid is True
+        assert result.payment_hash == payment_hash
+
+    def test_reports_each_failure(self):
+        mac = create_macaroon(SECRET, payment_hash=PREIMAGE_HASH_BYTES.hex(), endpoint="/api/x")
+        assert verify_macaroon_raw(SECRET, "garbage!!", PREIMAGE).error == "Invalid macaroon"
+        assert "signature" in verify_macaroon_raw("other", mac.raw, PREIMAGE).error.lower()
+        mismatch = verify_macaroon_raw(SECRET, mac.raw, PREIMAGE, {"endpoint": "/api/y"})
+        assert "Endpoint mismatch" in mismatch.error
+        assert "preimage" in verify_macaroon_raw(SECRET, mac.raw, "00" * 32).error.lower()
+
 
 class TestVerifyPreimage:
     def test_valid_preimage(self):
-        import hashlib
-
-        preimage = "deadbeef" * 8  # 32 bytes hex
-        payment_hash = hashlib.sha256(bytes.fromhex(preimage)).hexdigest()
-        assert verify_preimage(preimage, payment_hash) is True
+        assert verify_preimage(PREIMAGE, PREIMAGE_HASH_BYTES.hex()) is True
+        assert verify_preimage(PREIMAGE, PREIMAGE_HASH_BYTES) is True
 
     def test_invalid_preimage(self):
         assert verify_preimage("0000" * 8, "ffff" * 8) is False
@@ -210,6 +374,10 @@ class TestVerifyPreimage:
     def test_non_hex_input(self):
         assert verify_preimage("not-hex", "also-not-hex") is False
 
+    def test_non_string_input(self):
+        assert verify_preimage(12345, PAYMENT_HASH) is False
+        assert verify_preimage("ab" * 32, 12345) is False
+
 
 class TestInteroperability:
     """Test that Python macaroons match Node.js format exactly."""
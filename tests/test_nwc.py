@@ -0,0 +1,259 @@
+"""Tests for the NWC wallet client."""
+
+import asyncio
+import hashlib
+import json
+
+import pytest
+from coincurve import PublicKeyXOnly
+
+from lightning_toll import nwc as nwc_module
+from lightning_toll.crypto import get_public_key, nip04_decrypt, nip04_encrypt
+from lightning_toll.nwc import NwcWallet, _serialize_event, parse_nwc_url
+
+
+CLIENT_SECRET = "33" * 32
+WALLET_SECRET = "44" * 32
+WALLET_PUBKEY = get_public_key(WALLET_SECRET)
+NWC_URL = f"nostr+walletconnect://{WALLET_PUBKEY}?relay=wss://relay.test&secret={CLIENT_SECRET}"
+
+
+class FakeRelay:
+    """In-memory relay fronting a wallet service that answers NIP-47 requests."""
+
+    def __init__(self, results=None):
+        self.results = results or {}
+        self.silent = False  # when set, the wallet service never answers
+        self.frames = []
+        self.subs = {}
+        self.inbox = asyncio.Queue()
+        self.connects = 0
+        self.closes = 0
+
+    async def send(self, frame):
+        assert isinstance(frame, str)  # relays expect text frames
+        msg = json.loads(frame)
+        self.frames.append(msg)
+        if msg[0] == "REQ":
+            self.subs[msg[1]] = msg[2]
+        elif msg[0] == "CLOSE":
+            self.subs.pop(msg[1], None)
+        elif msg[0] == "EVENT" and not self.silent:
+            self._answer(msg[1])
+
+    def _answer(self, event):
+        event_hash = hashlib.sha256(_serialize_event(event).encode()).digest()
+        assert event["id"] == event_hash.hex()
+        assert PublicKeyXOnly(bytes.fromhex(event["pubkey"])).verify(
+            bytes.fromhex(event["sig"]), event_hash
+        )
+        request = json.loads(nip04_decrypt(WALLET_SECRET, event["pubkey"], event["content"]))
+        reply = {"result_type": request["method"], "result": self.results.get(request["method"], {})}
+        response = {
+            "kind": 23195,
+            "pubkey": WALLET_PUBKEY,
+            "tags": [["p", event["pubkey"]], ["e", event["id"]]],
+            "content": nip04_encrypt(WALLET_SECRET, event["pubkey"], json.dumps(reply)),
+        }
+        # Unrelated traffic a busy relay would interleave
+        self.inbox.put_nowait(json.dumps(["NOTICE", "rate limited"]))
+        self.inbox.put_nowait(json.dumps(["EVENT", "other-sub", {"kind": 1, "content": "hi"}]))
+        for sub_id, sub_filter in self.subs.items():
+            if event["pubkey"] in sub_filter["#p"] and (
+                "#e" not in sub_filter or event["id"] in sub_filter["#e"]
+            ):
+                self.inbox.put_nowait(json.dumps(["EVENT", sub_id, response]))
+
+    async def recv(self):
+        frame = await self.inbox.get()
+        if frame is None:
+            raise ConnectionError("relay went away")
+        return frame
+
+    def drop(self):
+        """Simulate the relay closing the connection."""
+        self.inbox.put_nowait(None)
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        self.closes += 1
+
+
+@pytest.fixture
+def relay(monkeypatch):
+    relay = FakeRelay()
+
+    async def connect(url, **kwargs):
+        relay.connects += 1
+        return relay
+
+    monkeypatch.setattr(nwc_module, "connect_relay", connect)
+    return relay
+
+
+class TestParseNwcUrl:
+    def test_parses_relay_pubkey_and_secret(self):
+        config = parse_nwc_url(NWC_URL)
+        assert config.relay_url == "wss://relay.test"
+        assert config.wallet_pubkey == WALLET_PUBKEY
+        assert config.client_pubkey == get_public_key(CLIENT_SECRET)
+
+    def test_rejects_wrong_scheme(self):
+        with pytest.raises(ValueError, match="scheme"):
+            parse_nwc_url("https://example.com")
+
+
+class TestSerializeEvent:
+    def test_is_compact_nip01_array(self):
+        event = {"pubkey": "ab", "created_at": 1, "kind": 1, "tags": [], "content": "⚡"}
+        assert _serialize_event(event) == '[0,"ab",1,1,[],"⚡"]'
+
+    def test_request_template_matches_generic_serializer(self):
+        wallet = NwcWallet(NWC_URL)
+        for content in ("abc?iv=def", 'quote " and \\ backslash', "line\nbreak ⚡"):
+            event = {
+                "pubkey": wallet.config.client_pubkey,
+                "created_at": 1700000000,
+                "kind": 23194,
+                "tags": [["p", WALLET_PUBKEY]],
+                "content": content,
+            }
+            assert wallet._serialize_request(1700000000, content) == _serialize_event(event)
+
+    def test_event_frame_matches_generic_encoder(self):
+        wallet = NwcWallet(NWC_URL)
+        event = {
+            "kind": 23194,
+            "pubkey": wallet.config.client_pubkey,
+            "created_at": 1700000000,
+            "tags": [["p", WALLET_PUBKEY]],
+            "content": 'abc+/=?iv="x"',
+            "id": "ab" * 32,
+            "sig": "cd" * 64,
+        }
+        assert json.loads(wallet._event_frame(event)) == ["EVENT", event]
+
+
+class TestNwcWallet:
+    @pytest.mark.asyncio
+    async def test_create_invoice_round_trip(self, relay):
+        relay.results["make_invoice"] = {"invoice": "lnbc10n1test", "payment_hash": "ab" * 32}
+        wallet = NwcWallet(NWC_URL)
+
+        result = await wallet.create_invoice(amount_sats=1, description="test")
+
+        assert result.invoice == "lnbc10n1test"
+        assert result.payment_hash == "ab" * 32
+        assert [frame[0] for frame in relay.frames][:2] == ["REQ", "EVENT"]
+        await wallet.close()
+
+    @pytest.mark.asyncio
+    async def test_pay_invoice_requires_preimage(self, relay):
+        wallet = NwcWallet(NWC_URL)
+        relay.results["pay_invoice"] = {}
+
+        with pytest.raises(RuntimeError, match="no preimage"):
+            await wallet.pay_invoice("lnbc10n1test")
+        await wallet.close()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_subscription(self, relay):
+        relay.results["make_invoice"] = {"invoice": "lnbc10n1test", "payment_hash": "ab" * 32}
+        wallet = NwcWallet(NWC_URL)
+
+        results = await asyncio.gather(
+            *(wallet.create_invoice(amount_sats=1) for _ in range(3))
+        )
+
+        assert [r.invoice for r in results] == ["lnbc10n1test"] * 3
+        assert [frame[0] for frame in relay.frames] == ["REQ", "EVENT", "EVENT", "EVENT"]
+        assert "#e" not in relay.frames[0][2]
+        await wallet.close()
+        assert relay.frames[-1][0] == "CLOSE"
+
+    @pytest.mark.asyncio
+    async def test_times_out_without_response(self, relay):
+        relay.silent = True
+        wallet = NwcWallet(NWC_URL)
+
+        with pytest.raises(TimeoutError):
+            await wallet._send_nwc_request("get_info", {}, timeout_ms=50)
+        assert wallet._pending == {}
+        await wallet.close()
+
+    @pytest.mark.asyncio
+    async def test_reconnects_after_relay_drops(self, relay):
+        relay.results["make_invoice"] = {"invoice": "lnbc10n1test", "payment_hash": "ab" * 32}
+        wallet = NwcWallet(NWC_URL)
+        await wallet.create_invoice(amount_sats=1)
+
+        relay.drop()
+        await asyncio.sleep(0)  # let the reader notice
+        result = await wallet.create_invoice(amount_sats=1)
+
+        assert result.invoice == "lnbc10n1test"
+        assert relay.connects == 2
+        assert relay.closes == 1  # the dropped socket was closed, not leaked
+        await wallet.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_subscribe_closes_socket(self, relay, monkeypatch):
+        async def send(frame):
+            raise ConnectionError("relay went away")
+
+        monkeypatch.setattr(relay, "send", send)
+        wallet = NwcWallet(NWC_URL)
+
+        with pytest.raises(ConnectionError):
+            await wallet._ensure_connected()
+        assert relay.closes == 1
+        assert wallet._ws is None
+
+    @pytest.mark.asyncio
+    async def test_malformed_response_does_not_kill_reader(self, relay):
+        relay.results["make_invoice"] = {"invoice": "lnbc10n1test", "payment_hash": "ab" * 32}
+        wallet = NwcWallet(NWC_URL)
+        await wallet.create_invoice(amount_sats=1)
+
+        sub_id = wallet._sub_id
+        for tags in (None, [5], [["e", ["x"]]], 7):
+            relay.inbox.put_nowait(json.dumps(["EVENT", sub_id, {"kind": 23195, "tags": tags}]))
+        result = await wallet.create_invoice(amount_sats=1)
+
+        assert result.invoice == "lnbc10n1test"
+        assert relay.connects == 1
+        await wallet.close()
+
+    @pytest.mark.asyncio
+    async def test_wait_for_payment_polls_until_paid(self, relay):
+        relay.results["lookup_invoice"] = {"settled_at": 1700000000}
+        wallet = NwcWallet(NWC_URL)
+        lookups = []
+        real_lookup = wallet.lookup_invoice
+
+        async def lookup(payment_hash):
+            lookups.append(payment_hash)
+            if len(lookups) < 3:
+                raise ConnectionError("transient")
+            return await real_lookup(payment_hash)
+
+        wallet.lookup_invoice = lookup
+        result = await wallet.wait_for_payment("ab" * 32, timeout_ms=2000, poll_interval_ms=1)
+
+        assert result.paid is True
+        assert result.settled_at == 1700000000
+        assert len(lookups) == 3
+        await wallet.close()
+
+    @pytest.mark.asyncio
+    async def test_wait_for_payment_gives_up_at_deadline(self, relay):
+        relay.silent = True
+        wallet = NwcWallet(NWC_URL)
+
+        result = await wallet.wait_for_payment("ab" * 32, timeout_ms=50, poll_interval_ms=10)
+
+        assert result.paid is False
+        assert wallet._pending == {}
+        await wallet.close()
@@ -0,0 +1,41 @@
+"""Tests for relay WebSocket connections."""
+
+import pytest
+from websockets.asyncio.server import serve
+
+from lightning_toll.relay import PICOWS_AVAILABLE, connect_relay
+
+
+BACKENDS = [
+    "websockets",
+    pytest.param(
+        "picows", marks=pytest.mark.skipif(not PICOWS_AVAILABLE, reason="picows not installed")
+    ),
+]
+
+
+async def echo(ws):
+    async for message in ws:
+        await ws.send(message)
+        # A fragmented text message, as some relays send large events
+        await ws.send(iter(["frag", "mented"]))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.asyncio
+async def test_send_recv_close(backend):
+    async with serve(echo, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        conn = await connect_relay(f"ws://127.0.0.1:{port}", backend=backend)
+
+        await conn.send('["REQ","sub",{}]')
+        assert await conn.recv() == '["REQ","sub",{}]'
+        assert await conn.recv() == "fragmented"
+        await conn.ping()
+        await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_rejects_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown relay backend"):
+        await connect_relay("ws://127.0.0.1:1", backend="carrier-pigeon")
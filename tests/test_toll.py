@@ -1,20 +1,26 @@
 """Tests for the toll middleware with FastAPI."""
 
+import asyncio
 import hashlib
+import json
 import time
 from dataclasses import dataclass
-from typing import Optional
-from unittest.mock import AsyncMock, MagicMock
+from typing import Dict, Optional
 
 import pytest
+from fastapi import HTTPException
 
 from lightning_toll import create_toll
+from lightning_toll._compat import DATACLASS_SLOTS
 from lightning_toll.macaroon import create_macaroon
+from lightning_toll.middleware import parse_window
+from lightning_toll.stats import HyperLogLog, TollStats
 
 
 SECRET = "test-secret-for-toll-middleware"
 PAYMENT_HASH = "b1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6a1b2c3d4e5f6b1b2"
 PREIMAGE = "deadbeefdeadbeefdeadbeefdeadbeefdeadbeefdeadbeefdeadbeefdeadbeef"
+PREIMAGE_HASH = hashlib.sha256(bytes.fromhex(PREIMAGE)).hexdigest()  # hash that PREIMAGE settles
 
 
 @dataclass
@@ -30,13 +36,48 @@ class FakeLookupResult:
     settled_at: Optional[int] = None
 
 
-def make_fake_wallet():
-    """Create a mock wallet for testing."""
-    wallet = AsyncMock()
-    wallet.create_invoice = AsyncMock(return_value=FakeInvoiceResult())
-    wallet.lookup_invoice = AsyncMock(return_value=FakeLookupResult())
-    wallet.wait_for_payment = AsyncMock(return_value=FakeLookupResult())
-    return wallet
+INVOICE = FakeInvoiceResult()
+UNPAID = FakeLookupResult()
+
+
+class FakeWallet:
+    """Wallet stub returning fixed results, without AsyncMock's call tracking."""
+
+    def __init__(self, lookup: FakeLookupResult = UNPAID):
+        self.lookup = lookup
+
+    async def create_invoice(self, **kwargs):
+        return INVOICE
+
+    async def lookup_invoice(self, payment_hash):
+        return self.lookup
+
+    async def wait_for_payment(self, payment_hash, **kwargs):
+        return self.lookup
+
+
+def make_fake_wallet(lookup: FakeLookupResult = UNPAID) -> FakeWallet:
+    """Create a stub wallet for testing."""
+    return FakeWallet(lookup)
+
+
+@dataclass(**DATACLASS_SLOTS)
+class FakeURL:
+    path: str
+
+
+@dataclass(**DATACLASS_SLOTS)
+class FakeClient:
+    host: str
+
+
+@dataclass(**DATACLASS_SLOTS)
+class FakeRequest:
+    """The parts of a FastAPI Request the middleware reads."""
+    url: FakeURL
+    method: str
+    headers: Dict[str, str]
+    client: FakeClient
 
 
 def make_fake_request(
@@ -44,17 +85,10 @@ def make_fake_request(
     method: str = "GET",
     auth_header: Optional[str] = None,
     client_host: str = "127.0.0.1",
-):
-    """Create a mock FastAPI Request object."""
-    request = MagicMock()
-    request.url.path = path
-    request.method = method
-    request.headers = {}
-    if auth_header:
-        request.headers["authorization"] = auth_header
-    request.client = MagicMock()
-    request.client.host = client_host
-    return request
+) -> FakeRequest:
+    """Create a stand-in for a FastAPI Request object."""
+    headers = {"authorization": auth_header} if auth_header else {}
+    return FakeRequest(FakeURL(path), method, headers, FakeClient(client_host))
 
 
 class TestCreateToll:
@@ -78,6 +112,22 @@ class TestCreateToll:
             create_toll(wallet=object(), secret=SECRET)
 
 
+class TestParseWindow:
+    def test_parses_units(self):
+        assert parse_window("250ms") == 250
+        assert parse_window("30s") == 30000
+        assert parse_window("30m") == 1800000
+        assert parse_window("2h") == 7200000
+        assert parse_window("1d") == 86400000
+
+    def test_passes_through_milliseconds(self):
+        assert parse_window(500) == 500
+
+    def test_falls_back_to_one_hour(self):
+        for window in (None, "", "ms", "1.5h", "10", "1w"):
+            assert parse_window(window) == 3600000
+
+
 class TestTollMiddleware:
     """Test the toll gate middleware behavior."""
 
@@ -91,8 +141,6 @@ class TestTollMiddleware:
         request = make_fake_request()
 
         # The middleware should raise an HTTPException with status 402
-        from fastapi import HTTPException
-
         with pytest.raises(HTTPException) as exc_info:
             await middleware(request)
 
@@ -104,6 +152,28 @@ class TestTollMiddleware:
         assert body["protocol"] == "L402"
         assert "macaroon" in body
 
+    @pytest.mark.asyncio
+    async def test_reports_settled_payment_to_on_payment(self):
+        wallet = make_fake_wallet(
+            FakeLookupResult(paid=True, preimage=PREIMAGE, settled_at=1700000000)
+        )
+        payments = []
+        toll = create_toll(wallet=wallet, secret=SECRET, on_payment=payments.append)
+        middleware = toll(sats=5)
+
+        with pytest.raises(HTTPException):
+            await middleware(make_fake_request(client_host="10.0.0.9"))
+        await asyncio.sleep(0)  # let the monitor task run
+
+        assert payments == [{
+            "payment_hash": PAYMENT_HASH,
+            "amount_sats": 5,
+            "endpoint": "/api/test",
+            "client_id": "10.0.0.9",
+            "preimage": PREIMAGE,
+            "settled_at": 1700000000,
+        }]
+
     @pytest.mark.asyncio
     async def test_accepts_valid_l402_auth(self):
         """Request with valid L402 auth should pass through."""
@@ -116,13 +186,10 @@ class TestTollMiddleware:
         )
         middleware = toll(sats=5)
 
-        # Create a valid macaroon and preimage
-        preimage_bytes = bytes.fromhex(PREIMAGE)
-        payment_hash = hashlib.sha256(preimage_bytes).hexdigest()
-
+        # Create a valid macaroon for the preimage
         mac = create_macaroon(
             SECRET,
-            payment_hash=payment_hash,
+            payment_hash=PREIMAGE_HASH,
             expires_at=int(time.time()) + 3600,
         )
 
@@ -131,7 +198,7 @@ class TestTollMiddleware:
 
         result = await middleware(request)
         assert result["paid"] is True
-        assert result["payment_hash"] == payment_hash
+        assert result["payment_hash"] == PREIMAGE_HASH
 
     @pytest.mark.asyncio
     async def test_rejects_invalid_macaroon(self):
@@ -142,8 +209,6 @@ class TestTollMiddleware:
 
         request = make_fake_request(auth_header="L402 garbage:deadbeef")
 
-        from fastapi import HTTPException
-
         with pytest.raises(HTTPException) as exc_info:
             await middleware(request)
 
@@ -172,8 +237,6 @@ class TestTollMiddleware:
         auth_header = f"L402 {mac.raw}:{wrong_preimage}"
         request = make_fake_request(auth_header=auth_header)
 
-        from fastapi import HTTPException
-
         with pytest.raises(HTTPException) as exc_info:
             await middleware(request)
 
@@ -192,20 +255,15 @@ class TestTollMiddleware:
         )
         middleware = toll(sats=5)
 
-        preimage_bytes = bytes.fromhex(PREIMAGE)
-        payment_hash = hashlib.sha256(preimage_bytes).hexdigest()
-
         mac = create_macaroon(
             SECRET,
-            payment_hash=payment_hash,
+            payment_hash=PREIMAGE_HASH,
             expires_at=int(time.time()) - 100,  # already expired
         )
 
         auth_header = f"L402 {mac.raw}:{PREIMAGE}"
         request = make_fake_request(auth_header=auth_header)
 
-        from fastapi import HTTPException
-
         with pytest.raises(HTTPException) as exc_info:
             await middleware(request)
 
@@ -228,12 +286,37 @@ class TestTollMiddleware:
             assert result["free"] is True
 
         # 4th request should require payment
-        from fastapi import HTTPException
-
         with pytest.raises(HTTPException) as exc_info:
             await middleware(request)
         assert exc_info.value.status_code == 402
 
+    @pytest.mark.asyncio
+    async def test_free_tier_resets_after_window(self, monkeypatch):
+        from lightning_toll import middleware as middleware_module
+
+        clock = [10**12]
+        monkeypatch.setattr(middleware_module.time, "monotonic_ns", lambda: clock[0])
+        toll = create_toll(wallet=make_fake_wallet(), secret=SECRET)
+        middleware = toll(sats=5, free_requests=1, free_window="1s")
+        request = make_fake_request(client_host="10.0.0.1")
+
+        assert middleware._check_free_tier("10.0.0.1") is True
+        assert middleware._check_free_tier("10.0.0.1") is False
+        clock[0] += 1_000_000_001
+        assert (await middleware(request))["free"] is True
+
+    @pytest.mark.asyncio
+    async def test_free_tier_tracks_bounded_clients(self):
+        wallet = make_fake_wallet()
+        toll = create_toll(wallet=wallet, secret=SECRET)
+        middleware = toll(sats=5, free_requests=1, free_window="1h")
+        middleware._free_tier_max = 2
+
+        for host in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+            await middleware(make_fake_request(client_host=host))
+
+        assert list(middleware._free_tier_map) == ["10.0.0.2", "10.0.0.3"]
+
     @pytest.mark.asyncio
     async def test_stats_tracked(self):
         """Stats should be updated on paid requests."""
@@ -246,12 +329,9 @@ class TestTollMiddleware:
         )
         middleware = toll(sats=10)
 
-        preimage_bytes = bytes.fromhex(PREIMAGE)
-        payment_hash = hashlib.sha256(preimage_bytes).hexdigest()
-
         mac = create_macaroon(
             SECRET,
-            payment_hash=payment_hash,
+            payment_hash=PREIMAGE_HASH,
             expires_at=int(time.time()) + 3600,
         )
 
@@ -266,6 +346,40 @@ class TestTollMiddleware:
         assert stats["totalRequests"] == 1
 
 
+class TestTollRequire:
+    @pytest.mark.asyncio
+    async def test_injects_payment_when_accepted(self):
+        toll = create_toll(wallet=make_fake_wallet(), secret=SECRET)
+
+        @toll.require(sats=5, free_requests=1)
+        async def handler(request, payment=None):
+            return payment
+
+        payment = await handler(make_fake_request())
+        assert payment["free"] is True
+
+    @pytest.mark.asyncio
+    async def test_finds_request_keyword(self):
+        toll = create_toll(wallet=make_fake_wallet(), secret=SECRET)
+
+        @toll.require(sats=5, free_requests=1)
+        async def handler(request):
+            return "ok"
+
+        assert await handler(request=make_fake_request()) == "ok"
+
+    @pytest.mark.asyncio
+    async def test_requires_request(self):
+        toll = create_toll(wallet=make_fake_wallet(), secret=SECRET)
+
+        @toll.require(sats=5)
+        async def handler():
+            return "ok"
+
+        with pytest.raises(RuntimeError, match="request: Request"):
+            await handler()
+
+
 class TestTollDashboard:
     def test_dashboard_returns_stats(self):
         wallet = make_fake_wallet()
@@ -281,5 +395,73 @@ class TestTollDashboard:
         assert data["totalPaid"] == 2
         assert data["totalRequests"] == 3
         assert data["uniquePayers"] == 2
-        assert "/api/test" in data["endpoints"]
-        assert "/api/other" in data["endpoints"]
+        assert data["endpoints"]["/api/test"] == {"revenue": 10, "requests": 2, "paid": 2, "free": 0}
+        assert data["endpoints"]["/api/other"] == {"revenue": 0, "requests": 1, "paid": 0, "free": 1}
+
+    @pytest.mark.asyncio
+    async def test_dashboard_handler_serves_cached_json(self):
+        toll = create_toll(wallet=make_fake_wallet(), secret=SECRET)
+        toll.stats.record("/api/test", True, 5, "client1", "hash1")
+        handler = toll.dashboard()
+
+        response = await handler()
+        assert response.media_type == "application/json"
+        assert json.loads(response.body)["totalRevenue"] == 5
+        assert toll.stats.to_json_bytes() is toll.stats.to_json_bytes()
+
+        toll.stats.record("/api/test", True, 5, "client2", "hash2")
+        response = await handler()
+        assert json.loads(response.body)["totalRevenue"] == 10
+
+    def test_summary_cached_until_next_record(self):
+        stats = TollStats()
+        stats.record("/api/test", True, 5, "client1")
+        first = stats.to_dict()
+        assert stats.to_dict() is first
+
+        stats.record("/api/test", False)
+        assert stats.to_dict() is not first
+        assert stats.to_dict()["totalRequests"] == 2
+
+    def test_recent_payments_are_bounded_newest_first(self):
+        stats = TollStats(max_recent=3)
+        for i in range(5):
+            stats.record("/api/test", True, 1, f"client{i}", f"hash{i}")
+
+        recent = stats.to_dict()["recentPayments"]
+        assert [r["paymentHash"] for r in recent] == ["hash4", "hash3", "hash2"]
+
+    def test_unique_payers_exact_by_default(self):
+        stats = TollStats()
+        for i in range(50):
+            stats.record("/api/test", True, 1, f"client{i % 10}")
+        assert stats.to_dict()["uniquePayers"] == 10
+        assert stats._payers_hll is None
+
+    def test_unique_payers_switch_to_sketch_past_limit(self):
+        stats = TollStats(max_exact_payers=100)
+        for i in range(2_000):
+            stats.record("/api/test", True, 1, f"10.{i}")
+        assert stats._payers is None
+        assert abs(stats.to_dict()["uniquePayers"] - 2_000) < 2_000 * 0.03
+
+
+class TestHyperLogLog:
+    def test_small_counts_are_exact(self):
+        hll = HyperLogLog()
+        for i in range(20):
+            hll.add(f"client{i}")
+            hll.add(f"client{i}")
+        assert hll.estimate() == 20
+
+    def test_large_counts_within_error(self):
+        hll = HyperLogLog()
+        for i in range(50_000):
+            hll.add(f"10.{i}")
+        assert abs(hll.estimate() - 50_000) < 50_000 * 0.03
+
+    def test_histogram_tracks_registers(self):
+        hll = HyperLogLog(precision=8)
+        for i in range(1_000):
+            hll.add(str(i))
+        assert hll._histogram == [hll._registers.count(r) for r in range(len(hll._histogram))]